@@ -1,91 +1,1009 @@
+import csv
+import errno
+import io
+import json
+import os
+import select
+import shutil
 import socket
 import subprocess
+import sys
+import threading
+import time
 import unittest
-from unittest.mock import MagicMock, mock_open, patch
+from unittest.mock import MagicMock, call, mock_open, patch
+from xml.etree import ElementTree
 
-from tunnel_manager import TunnelManager, TunnelManagerError, TunnelType
+import tunnel_manager
+from tunnel_manager import NetlinkError, OutputFormatterFactory, OutputFormatType, TunnelFactory, TunnelManager, TunnelManagerError, TunnelType, _ip_batch_supported, _resolve, _spawn_options
+
+
+IP_LINK_SHOW_VXLAN = b"""[{"ifindex":7,"ifname":"vxlan1001","flags":["BROADCAST","MULTICAST","UP","LOWER_UP"],"mtu":1450,"qdisc":"noqueue","master":"br0","operstate":"UNKNOWN","linkmode":"DEFAULT","group":"default","txqlen":1000,"link_type":"ether","address":"6a:3c:1f:00:ab:01","broadcast":"ff:ff:ff:ff:ff:ff","promiscuity":1,"min_mtu":68,"max_mtu":65535,"linkinfo":{"info_kind":"vxlan","info_data":{"id":1001,"remote":"192.168.1.2","local":"192.168.1.1","link":"eth0","port_range":{"low":0,"high":0},"port":4789,"ttl":0,"ageing":300,"udp_csum":true},"info_slave_kind":"bridge","info_slave_data":{"state":"forwarding","priority":32,"cost":100}}},
+{"ifindex":8,"ifname":"vxlan9","flags":["BROADCAST","MULTICAST"],"mtu":1450,"qdisc":"noop","operstate":"DOWN","linkmode":"DEFAULT","group":"default","txqlen":1000,"link_type":"ether","address":"6a:3c:1f:00:ab:02","broadcast":"ff:ff:ff:ff:ff:ff","promiscuity":0,"min_mtu":68,"max_mtu":65535,"linkinfo":{"info_kind":"vxlan","info_data":{"id":9,"group":"239.1.1.1","link":"eth0","port_range":{"low":0,"high":0},"port":4789,"ttl":0,"ageing":300}}}]
+"""
+
+IP_LINK_SHOW_GENEVE = b"""[{"ifindex":9,"ifname":"geneve1001","flags":["BROADCAST","MULTICAST","UP","LOWER_UP"],"mtu":1430,"qdisc":"noqueue","master":"br0","operstate":"UNKNOWN","linkmode":"DEFAULT","group":"default","txqlen":1000,"link_type":"ether","address":"52:1e:02:00:ab:03","broadcast":"ff:ff:ff:ff:ff:ff","promiscuity":1,"min_mtu":68,"max_mtu":65465,"linkinfo":{"info_kind":"geneve","info_data":{"id":1001,"remote6":"2001:db8::2","ttl":0,"port":6081,"udp_csum":false,"udp_zero_csum6_rx":true}}}]
+"""
+
+# Commands the `ip` fallback runs for VNI 1001 between 192.168.1.1 and 192.168.1.2 on br0
+VXLAN_ADD_ARGV = ("ip", "link", "add", "vxlan1001", "master", "br0", "up", "type", "vxlan", "id", "1001", "local", "192.168.1.1", "remote", "192.168.1.2", "dstport", "4789", "dev", "eth0")
+GENEVE_ADD_ARGV = ("ip", "link", "add", "geneve1001", "master", "br0", "up", "type", "geneve", "id", "1001", "remote", "192.168.1.2", "dstport", "6081")
+VXLAN_DEL_ARGV = ("ip", "link", "del", "vxlan1001")
+BRCTL_DELIF_ARGV = ("brctl", "delif", "br0", "vxlan1001")
+
+# A probe that passes waits out its whole timeout, so loopback probes expected to pass get a short one;
+# probes expected to be refused keep longer timeouts, which the refusal cuts short anyway
+PASSING_PROBE_WAIT = 0.05
 
 
 class TestTunnelManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Managers keep no state of their own (caches are module-level and patched per test), so one pair serves every test
+        cls.vxlan_manager = TunnelManager(TunnelType.VXLAN)
+        cls.geneve_manager = TunnelManager(TunnelType.GENEVE)
+
     def setUp(self):
-        # Create a VXLAN tunnel manager
-        self.vxlan_manager = TunnelManager(TunnelType.VXLAN)
+        # Force the `ip` command path; netlink is covered by TestNetlinkTunnelManager
+        netlink_patcher = patch.object(tunnel_manager, "_netlink", return_value=None)
+        netlink_patcher.start()
+        self.addCleanup(netlink_patcher.stop)
 
-        # Create a Geneve tunnel manager
-        self.geneve_manager = TunnelManager(TunnelType.GENEVE)
+        _resolve.cache_clear()
+        listings_patcher = patch.dict(tunnel_manager._listings, clear=True)
+        listings_patcher.start()
+        self.addCleanup(listings_patcher.stop)
 
-    # Test cases for creating tunnels
-    @patch("tunnel_manager.subprocess.run")
-    def test_create_vxlan_interface_success(self, mock_run):
-        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
-        mock_run.assert_called()
+        # No test here may run a real command. Commands answer with a real CompletedProcess rather than a
+        # MagicMock, so code reading an attribute run() never returns fails instead of getting a child mock
+        run_patcher = patch.object(subprocess, "run", return_value=subprocess.CompletedProcess([], 0, stdout=b"", stderr=b""))
+        self.mock_run = run_patcher.start()
+        self.addCleanup(run_patcher.stop)
+
+        # Exercise the one-command-per-process path unless a test opts into `ip -batch`
+        batch_patcher = patch.object(tunnel_manager, "_ip_batch_supported", return_value=False)
+        self.mock_batch_supported = batch_patcher.start()
+        self.addCleanup(batch_patcher.stop)
+
+        # Retries back off for real time otherwise
+        sleep_patcher = patch.object(time, "sleep")
+        self.mock_sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def assertRan(self, *argvs):
+        """Assert that exactly these commands ran, in order, each checked and spawned as _run does."""
+        # Plain tuple and dict comparisons rather than mock.call equality
+        calls = self.mock_run.call_args_list
+        self.assertEqual([tuple(c.args[0]) for c in calls], list(argvs))
+        for c, argv in zip(calls, argvs):
+            self.assertEqual(c.kwargs, {"check": True, **_spawn_options(argv[0])})
+
+    # Test cases for creating tunnels, one subtest per (manager, extra create arguments, expected argv)
+    CREATE_CASES = (
+        ("vxlan_manager", {"dev": "eth0"}, VXLAN_ADD_ARGV),
+        # Geneve has no underlay device, so none is passed to ip
+        ("geneve_manager", {"dev": "eth0"}, GENEVE_ADD_ARGV),
+    )
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_create_vxlan_interface_failure(self, mock_run):
-        mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
+    def test_create_interface_argv(self):
+        for manager, kwargs, argv in self.CREATE_CASES:
+            with self.subTest(manager=manager):
+                self.mock_run.reset_mock()
+                getattr(self, manager).create(1001, "192.168.1.1", "192.168.1.2", "br0", **kwargs)
+                # One ip process creates the link already enslaved and up
+                self.assertRan(argv)
+
+    def test_create_interface_failure(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
+        for manager, kwargs, _ in self.CREATE_CASES:
+            with self.subTest(manager=manager), self.assertRaises(TunnelManagerError):
+                getattr(self, manager).create(1001, "192.168.1.1", "192.168.1.2", "br0", **kwargs)
+
+    def test_create_vxlan_interface_failure_leaves_nothing_behind(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(2, ["ip", "link", "add"], stderr="Error: argument \"br0\" is wrong: Device does not exist\n")
         with self.assertRaises(TunnelManagerError):
             self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        # The kernel created nothing, so there is no link to roll back
+        self.mock_run.assert_called_once()
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_create_geneve_interface_success(self, mock_run):
-        self.geneve_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
-        mock_run.assert_called()
+    def test_create_single_link_skips_batch(self):
+        self.mock_batch_supported.return_value = True
+        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        self.assertEqual(self.mock_run.call_args.args[0][:3], ["ip", "link", "add"])
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_create_geneve_interface_failure(self, mock_run):
-        mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
-        with self.assertRaises(TunnelManagerError):
-            self.geneve_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+    def test_execute_action(self):
+        self.vxlan_manager.execute_action("cleanup", vni=1001, bridge_name="br0")
+        self.assertRan(VXLAN_DEL_ARGV)
+        for action in ("execute_action", "_create", "tunnel", "missing"):
+            with self.assertRaises(ValueError):
+                self.vxlan_manager.execute_action(action)
+
+    def test_bulk_actions_fall_back_for_other_tunnels(self):
+        tunnel = MagicMock(spec=["DEFAULT_PORT", "create_tunnel_interface", "cleanup_tunnel_interface", "validate_connectivity", "collect_tunnel_data"])
+        tunnel.validate_connectivity.side_effect = [None, TunnelManagerError("unreachable")]
+        manager = TunnelManager(tunnel)
+        manager.create_many([{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"} for vni in (1001, 1002)])
+        manager.cleanup_many([{"vni": vni, "bridge_name": "br0"} for vni in (1001, 1002)])
+        self.assertEqual(manager.validate_many([("192.168.1.1", "192.168.1.2", 1001), ("192.168.1.1", "192.168.1.3", 1002)]), [True, False])
+        self.assertEqual(tunnel.create_tunnel_interface.call_count, 2)
+        self.assertEqual(tunnel.cleanup_tunnel_interface.call_args_list, [call(1001, "br0"), call(1002, "br0")])
+        self.assertEqual(tunnel.validate_connectivity.call_args_list, [call("192.168.1.1", "192.168.1.2", 1001, None, 3, 3), call("192.168.1.1", "192.168.1.3", 1002, None, 3, 3)])
+        self.mock_run.assert_not_called()
+
+    def test_create_many_single_batch(self):
+        self.mock_batch_supported.return_value = True
+        self.vxlan_manager.create_many([{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"} for vni in (1001, 1002)])
+        self.mock_run.assert_called_once()
+        self.assertEqual(
+            self.mock_run.call_args.kwargs["input"].splitlines(),
+            [
+                "link add vxlan1001 master br0 up type vxlan id 1001 local 192.168.1.1 remote 192.168.1.2 dstport 4789",
+                "link add vxlan1002 master br0 up type vxlan id 1002 local 192.168.1.1 remote 192.168.1.2 dstport 4789",
+            ],
+        )
+
+    def test_create_many_scales_to_one_process(self):
+        self.mock_batch_supported.return_value = True
+        self.vxlan_manager.create_many({"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0", "dev": "eth0"} for vni in range(1001, 2001))
+        # A thousand links, still one ip process reading one line per link
+        self.mock_run.assert_called_once()
+        self.assertEqual(self.mock_run.call_args.args[0], ["ip", "-batch", "-"])
+        lines = self.mock_run.call_args.kwargs["input"].splitlines()
+        self.assertEqual(len(lines), 1000)
+        self.assertEqual(lines[-1], " ".join(VXLAN_ADD_ARGV[1:]).replace("1001", "2000"))
+
+    def test_create_many_batch_failure_names_failed_link(self):
+        self.mock_batch_supported.return_value = True
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, ["ip", "-batch", "-"], stderr="RTNETLINK answers: File exists\nCommand failed -:2\n")
+        # Named as a single create names it
+        with self.assertRaisesRegex(TunnelManagerError, "^Error creating Geneve interface for VNI 1002$"):
+            self.geneve_manager.create_many([{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"} for vni in (1001, 1002, 1003)])
+        self.mock_run.assert_called_once()
+
+    def test_cleanup_many_single_batch(self):
+        self.mock_batch_supported.return_value = True
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, ["ip", "-batch", "-"], stderr="Cannot find device \"vxlan1002\"\nCommand failed -:2\n")
+        with self.assertRaisesRegex(TunnelManagerError, "VNI 1002"):
+            self.vxlan_manager.cleanup_many([{"vni": vni, "bridge_name": "br0"} for vni in (1001, 1002, 1003)])
+        self.mock_run.assert_called_once()
+        self.assertEqual(self.mock_run.call_args.kwargs["input"].splitlines(), ["link del vxlan1001", "link del vxlan1002", "link del vxlan1003"])
+
+    def test_cleanup_many_brctl_runs_per_link(self):
+        manager = TunnelManager(TunnelFactory.create_tunnel(TunnelType.VXLAN, bridge_tool="brctl"))
+        manager.cleanup_many([{"vni": vni, "bridge_name": "br0"} for vni in (1001, 1002)])
+        self.assertEqual([c.args[0][:2] for c in self.mock_run.call_args_list], [["brctl", "delif"], ["ip", "link"], ["brctl", "delif"], ["ip", "link"]])
+
+    def test_create_many_without_ip_batch_runs_one_script(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, ["sh", "-s"], stderr="ip: RTNETLINK answers: File exists\nCommand failed -:2\n")
+        with self.assertRaisesRegex(TunnelManagerError, "VNI 1002"):
+            self.vxlan_manager.create_many([{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br 0"} for vni in (1001, 1002)])
+        self.mock_run.assert_called_once()
+        self.assertEqual(self.mock_run.call_args.args[0], ["sh", "-s"])
+        self.assertEqual(
+            self.mock_run.call_args.kwargs["input"].splitlines(),
+            [
+                "ip link add vxlan1001 master 'br 0' up type vxlan id 1001 local 192.168.1.1 remote 192.168.1.2 dstport 4789 || { echo 'Command failed -:1' >&2; exit 1; }",
+                "ip link add vxlan1002 master 'br 0' up type vxlan id 1002 local 192.168.1.1 remote 192.168.1.2 dstport 4789 || { echo 'Command failed -:2' >&2; exit 1; }",
+            ],
+        )
+
+    @patch.object(os.path, "realpath", return_value="/bin/busybox")
+    @patch.object(shutil, "which", return_value="/sbin/ip")
+    def test_ip_batch_support_probed_once(self, mock_which, mock_realpath):
+        for cached in (_ip_batch_supported, tunnel_manager._which):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+        self.assertFalse(_ip_batch_supported())
+        self.assertFalse(_ip_batch_supported())
+        # Spawning ip reuses the lookup instead of searching PATH again
+        self.assertEqual(_spawn_options("ip")["executable"], "/sbin/ip")
+        mock_which.assert_called_once_with("ip", path=os.environ.get("PATH"))
+
+    @patch.object(tunnel_manager, "_which")
+    def test_spawn_options(self, mock_which):
+        mock_which.return_value = "/sbin/ip"
+        self.assertEqual(_spawn_options("ip"), {"executable": "/sbin/ip", "close_fds": False})
+        mock_which.return_value = None
+        self.assertEqual(_spawn_options("ip"), {})
+
+    def test_interface_names_interned(self):
+        self.assertIs(tunnel_manager._ifname("vxlan", 1001), tunnel_manager._ifname("vxlan", 1001))
+        self.assertEqual(tunnel_manager._ifname("geneve", 1001), "geneve1001")
+
+    def test_expand_fills_placeholders_only(self):
+        template = ("ip", "link", "del", "%(ifname)s", "id", "%(vni)d", "%(vni)d-%(ifname)s")
+        ifname = tunnel_manager._ifname("vxlan", 1001)
+        argv = tunnel_manager._expand(template, ifname=ifname, vni=1001)
+        self.assertEqual(argv, ["ip", "link", "del", "vxlan1001", "id", "1001", "1001-vxlan1001"])
+        # A word that is only a string placeholder takes the interned name itself
+        self.assertIs(argv[3], ifname)
+        self.assertIs(argv[0], template[0])
+
+    def test_create_tunnel_unsupported_type(self):
+        with self.assertRaises(ValueError):
+            TunnelFactory.create_tunnel("gre")
 
     # Test cases for cleaning up tunnels
-    @patch("tunnel_manager.subprocess.run")
-    def test_cleanup_vxlan_interface_success(self, mock_run):
+    def test_cleanup_vxlan_interface_success(self):
         self.vxlan_manager.cleanup(1001, "br0")
-        mock_run.assert_called()
+        self.mock_run.assert_called()
+
+    def test_cleanup_vxlan_interface_argv(self):
+        self.vxlan_manager.cleanup(1001, "br0")
+        self.assertRan(VXLAN_DEL_ARGV)
+
+    def test_cleanup_vxlan_interface_brctl_argv(self):
+        TunnelManager(TunnelFactory.create_tunnel(TunnelType.VXLAN, bridge_tool="brctl")).cleanup(1001, "br0")
+        # The port leaves the bridge before the link goes
+        self.assertRan(BRCTL_DELIF_ARGV, VXLAN_DEL_ARGV)
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_cleanup_vxlan_interface_failure(self, mock_run):
-        mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
+    def test_cleanup_vxlan_interface_failure(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
         with self.assertRaises(TunnelManagerError):
             self.vxlan_manager.cleanup(1001, "br0")
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_cleanup_geneve_interface_success(self, mock_run):
+    def test_cleanup_geneve_interface_success(self):
         self.geneve_manager.cleanup(1001, "br0")
-        mock_run.assert_called()
+        self.mock_run.assert_called()
 
-    @patch("tunnel_manager.subprocess.run")
-    def test_cleanup_geneve_interface_failure(self, mock_run):
-        mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
+    def test_cleanup_geneve_interface_failure(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, "ip")
         with self.assertRaises(TunnelManagerError):
             self.geneve_manager.cleanup(1001, "br0")
 
+    # Test cases for listing tunnels
+    def test_list_vxlan_interfaces(self):
+        self.mock_run.return_value.stdout = IP_LINK_SHOW_VXLAN
+        self.assertEqual(
+            self.vxlan_manager.list(),
+            [
+                {"ifname": "vxlan1001", "vni": "1001", "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "dst_port": "4789"},
+                {"ifname": "vxlan9", "vni": "9", "dst_host": "239.1.1.1", "dst_port": "4789"},
+            ],
+        )
+        self.mock_run.assert_called_once_with(("ip", "-d", "-j", "link", "show", "type", "vxlan"), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, **_spawn_options("ip"))
+
+    def test_list_geneve_interfaces(self):
+        self.mock_run.return_value.stdout = IP_LINK_SHOW_GENEVE
+        self.assertEqual(self.geneve_manager.list(), [{"ifname": "geneve1001", "vni": "1001", "dst_host": "2001:db8::2", "dst_port": "6081"}])
+
+    def test_list_empty_dump(self):
+        # Some ip builds print nothing rather than an empty array when no link of the kind exists
+        for stdout in (b"", b"\n"):
+            self.mock_run.return_value.stdout = stdout
+            self.assertEqual(self.vxlan_manager.list(), [])
+
+    def test_list_unparsable_dump(self):
+        self.mock_run.return_value.stdout = b"Option \"-j\" is unknown"
+        with self.assertLogs(tunnel_manager.logger, "ERROR"):
+            self.assertEqual(self.vxlan_manager.list(), [])
+
+    def test_list_dumps_every_time_without_netlink(self):
+        # Nothing reports link changes without the rtnetlink subscription, so no dump is reused
+        self.mock_run.return_value.stdout = IP_LINK_SHOW_GENEVE
+        self.assertEqual(self.geneve_manager.list(), self.geneve_manager.list())
+        self.assertEqual(self.mock_run.call_count, 2)
+
+    def test_list_ip_failure(self):
+        self.mock_run.side_effect = subprocess.CalledProcessError(1, ("ip", "-d", "link", "show", "type", "vxlan"), stderr=b"Error: Unknown device type.\n")
+        with self.assertLogs(tunnel_manager.logger, "ERROR") as logs:
+            self.assertEqual(self.vxlan_manager.list(), [])
+        self.assertIn("Unknown device type.", logs.output[0])
+
     # Test cases for validating tunnel connectivity
-    @patch("tunnel_manager.socket.socket")
-    def test_validate_vxlan_connectivity_success(self, mock_socket):
-        mock_socket_instance = mock_socket.return_value.__enter__.return_value
+    @patch.object(select, "select", return_value=([], [], []))
+    @patch.object(socket, "socket")
+    def test_validate_vxlan_connectivity_success(self, mock_socket, mock_select):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
         self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001)
-        mock_socket_instance.connect.assert_called_with(("192.168.1.2", 4789))
+        mock_socket.assert_called_once_with(socket.AF_INET, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK)
+        mock_socket_instance.setblocking.assert_not_called()
+        mock_socket_instance.connect_ex.assert_called_once_with(("192.168.1.2", 4789))
+        # A VXLAN header with the I flag set and VNI 1001
+        mock_socket_instance.send.assert_called_once_with(b"\x08\x00\x00\x00\x00\x03\xe9\x00")
+        # Nothing was rejected within the wait, which is capped well below the timeout
+        mock_select.assert_called_once_with([mock_socket_instance], [], [], tunnel_manager._PROBE_REJECT_WAIT)
+        mock_socket_instance.__exit__.assert_called_once()
 
-    @patch("tunnel_manager.socket.socket")
+    @patch.object(socket, "socket")
     def test_validate_vxlan_connectivity_failure(self, mock_socket):
-        mock_socket_instance = mock_socket.return_value.__enter__.return_value
-        mock_socket_instance.connect.side_effect = socket.error
-        with self.assertRaises(TunnelManagerError):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
+        mock_socket_instance.getsockopt.return_value = errno.ECONNREFUSED
+        with patch.object(select, "select", return_value=([mock_socket_instance], [], [])), self.assertRaises(TunnelManagerError):
             self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001)
+        # The port was refused, so no retry is sent
+        mock_socket.assert_called_once()
+
+    @patch.object(socket, "socket")
+    def test_validate_retries_unreachable_host(self, mock_socket):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
+        mock_socket_instance.getsockopt.return_value = errno.EHOSTUNREACH
+        with patch.object(select, "select", return_value=([mock_socket_instance], [], [])), self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001)
+        self.assertEqual(mock_socket.call_count, 3)
+        # Each retry waits twice as long as the one before
+        self.assertEqual(self.mock_sleep.call_args_list, [call(0.1), call(0.2)])
+
+    @patch.object(socket, "socket")
+    def test_validate_retries_stop_at_timeout(self, mock_socket):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = errno.ENETUNREACH
+        clock = [0.0]
+        self.mock_sleep.side_effect = lambda delay: clock.__setitem__(0, clock[0] + delay)
+        with patch.object(time, "monotonic", side_effect=lambda: clock[0]), self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001, timeout=0.25, max_retries=5)
+        # After 0.1s, a 0.2s pause would overrun what is left of the timeout
+        self.assertEqual(self.mock_sleep.call_args_list, [call(0.1)])
+        self.assertEqual(mock_socket.call_count, 2)
 
-    @patch("tunnel_manager.socket.socket")
-    def test_validate_geneve_connectivity_success(self, mock_socket):
-        mock_socket_instance = mock_socket.return_value.__enter__.return_value
+    @patch.object(socket, "socket")
+    def test_validate_timeout_counts_first_probe(self, mock_socket):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
+        mock_socket_instance.getsockopt.return_value = errno.EHOSTUNREACH
+        clock = [0.0]
+
+        def select_(*args):
+            # The rejection takes 0.2s to arrive
+            clock[0] += 0.2
+            return [mock_socket_instance], [], []
+
+        with patch.object(time, "monotonic", side_effect=lambda: clock[0]), patch.object(select, "select", side_effect=select_), self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001, timeout=0.25)
+        # Only 0.05s of the timeout is left after the first probe, too little for a 0.1s pause
+        self.mock_sleep.assert_not_called()
+        self.assertEqual(mock_socket.call_count, 1)
+
+    @patch.object(select, "select", return_value=([], [], []))
+    @patch.object(socket, "socket")
+    def test_validate_short_timeout_bounds_wait(self, mock_socket, mock_select):
+        mock_socket.return_value.connect_ex.return_value = 0
+        self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001, timeout=0.1)
+        self.assertEqual(mock_select.call_args.args[3], 0.1)
+
+    @patch.object(select, "select", return_value=([], [], []))
+    @patch.object(socket, "getaddrinfo", wraps=socket.getaddrinfo)
+    @patch.object(socket, "socket")
+    def test_validate_caches_resolution(self, mock_socket, mock_getaddrinfo, mock_select):
+        mock_socket.return_value.connect_ex.return_value = 0
+        self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001)
+        self.vxlan_manager.validate("192.168.1.1", "192.168.1.2", 1001)
+        mock_getaddrinfo.assert_called_once()
+
+    @patch.object(select, "select", return_value=([], [], []))
+    @patch.object(socket, "socket")
+    def test_validate_falls_back_to_next_address(self, mock_socket, mock_select):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.side_effect = [errno.ENETUNREACH, 0]
+        addresses = [(socket.AF_INET6, 0, 0, "", ("2001:db8::2", 4789, 0, 0)), (socket.AF_INET, 0, 0, "", ("192.0.2.2", 4789))]
+        with patch.object(socket, "getaddrinfo", return_value=addresses):
+            self.vxlan_manager.validate("192.168.1.1", "tunnel.example", 1001)
+        self.assertEqual(mock_socket.call_args_list, [call(socket.AF_INET6, tunnel_manager._PROBE_SOCK_TYPE), call(socket.AF_INET, tunnel_manager._PROBE_SOCK_TYPE)])
+        self.assertEqual(mock_socket_instance.connect_ex.call_args_list, [call(("2001:db8::2", 4789, 0, 0)), call(("192.0.2.2", 4789))])
+        mock_socket_instance.send.assert_called_once()
+
+    def test_validate_retries_probe(self):
+        attempts = (err for err in [errno.EHOSTUNREACH, errno.EHOSTUNREACH, 0])
+        with patch.object(tunnel_manager, "_probe_attempts", return_value=attempts) as mock_probe_attempts:
+            with self.assertRaises(TunnelManagerError):
+                self.geneve_manager.validate("192.168.1.1", "192.168.1.2", 1001, timeout=1, max_retries=2)
+        mock_probe_attempts.assert_called_once_with(((socket.AF_INET, ("192.168.1.2", 6081)),), b"\x00\x00\x65\x58\x00\x03\xe9\x00", 1, "192.168.1.1")
+        # The attempts stop after max_retries and their socket is released
+        self.assertEqual(list(attempts), [])
+
+    def test_validate_many_batched(self):
+        # Both the shared error-queue socket and the socket-per-probe fallback
+        for recverr in (tunnel_manager._RECVERR, {}):
+            with self.subTest(shared=bool(recverr)), patch.object(tunnel_manager, "_RECVERR", recverr):
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+                    listener.bind(("127.0.0.1", 0))
+                    open_port = listener.getsockname()[1]
+                    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as closed:
+                        closed.bind(("127.0.0.1", 0))
+                        closed_port = closed.getsockname()[1]
+                        results = self.vxlan_manager.validate_many([("192.168.1.1", "127.0.0.1", 1001), ("192.168.1.1", "127.0.0.1", 1002)], port=open_port, timeout=PASSING_PROBE_WAIT)
+                        self.assertEqual(results, [True, True])
+                        self.assertEqual({listener.recv(16), listener.recv(16)}, {b"\x08\x00\x00\x00\x00\x03\xe9\x00", b"\x08\x00\x00\x00\x00\x03\xea\x00"})
+                    # Nothing listens on the closed port any more, so the kernel answers with port unreachable
+                    self.assertEqual(self.vxlan_manager.validate_many([("192.168.1.1", "127.0.0.1", 1001)], port=closed_port, timeout=1), [False])
+
+    @unittest.skipUnless(tunnel_manager._RECVERR, "needs the Linux socket error queue")
+    def test_validate_many_shares_one_socket(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener, socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as closed:
+            listener.bind(("127.0.0.1", 0))
+            closed.bind(("127.0.0.1", 0))
+            targets = [(socket.AF_INET, ("127.0.0.1", sock.getsockname()[1])) for sock in (listener, closed, listener)]
+            closed.close()
+            with patch.object(socket, "socket", wraps=socket.socket) as mock_socket:
+                results = tunnel_manager._probe_many(targets, [b"probe001", b"probe002", b"probe003"], 0.2)
+        self.assertEqual(results, [0, errno.ECONNREFUSED, 0])
+        mock_socket.assert_called_once()
+
+    @unittest.skipUnless(tunnel_manager._RECVERR, "needs the Linux socket error queue")
+    def test_validate_many_discards_answers(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as peer:
+            peer.bind(("127.0.0.1", 0))
+
+            def echo():
+                payload, sender = peer.recvfrom(16)
+                peer.sendto(payload, sender)
+
+            answering = threading.Thread(target=echo)
+            answering.start()
+            select_ = tunnel_manager.selectors.DefaultSelector.select
+            with patch.object(tunnel_manager.selectors.DefaultSelector, "select", autospec=True, side_effect=select_) as mock_select:
+                results = tunnel_manager._probe_many([(socket.AF_INET, peer.getsockname())], [b"probe001"], 0.2)
+            answering.join()
+        self.assertEqual(results, [0])
+        # Without reading the answer, select would return at once until the wait ran out
+        self.assertLess(mock_select.call_count, 10)
+
+    def test_probes_leave_from_source_address(self):
+        for recverr in (tunnel_manager._RECVERR, {}):
+            with self.subTest(shared=bool(recverr)), patch.object(tunnel_manager, "_RECVERR", recverr):
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as listener:
+                    listener.bind(("127.0.0.1", 0))
+                    target = (socket.AF_INET, listener.getsockname())
+                    # 127.0.0.2 is a loopback address of this host; 192.0.2.1 is not, so routing picks the source instead
+                    results = tunnel_manager._probe_many([target, target], [b"probe001", b"probe002"], PASSING_PROBE_WAIT, ["127.0.0.2", "192.0.2.1"])
+                    self.assertEqual(results, [0, 0])
+                    self.assertEqual(sorted(listener.recvfrom(16)[1][0] for _ in range(2)), ["127.0.0.1", "127.0.0.2"])
+
+    def test_validate_many_retries_failures_only(self):
+        with patch.object(tunnel_manager, "_probe_many", side_effect=[[errno.EHOSTUNREACH, 0, errno.ECONNREFUSED], [0]]) as mock_probe_many:
+            self.assertEqual(self.vxlan_manager.validate_many([("192.168.1.1", "127.0.0.1", 1001), ("192.168.1.1", "127.0.0.2", 1002), ("192.168.1.1", "127.0.0.3", 1003)]), [True, True, False])
+        # The refused target is not probed again, and the second round backs off first
+        self.assertEqual(mock_probe_many.call_count, 2)
+        self.mock_sleep.assert_called_once_with(0.1)
+        self.assertEqual(mock_probe_many.call_args, call([(socket.AF_INET, ("127.0.0.1", 4789))], [b"\x08\x00\x00\x00\x00\x03\xe9\x00"], 3, ["192.168.1.1"]))
+
+    def test_validate_many_resolves_hosts_concurrently(self):
+        # Each lookup waits for the other, so serial resolution would break the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def getaddrinfo(host, port, type):
+            barrier.wait()
+            if host == "no-such-host.invalid":
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            return [(socket.AF_INET, type, 17, "", ("10.0.0.2", port))]
+
+        with patch.object(socket, "getaddrinfo", side_effect=getaddrinfo), patch.object(tunnel_manager, "_probe_many", return_value=[0]) as mock_probe_many:
+            with self.assertLogs(tunnel_manager.logger, "WARNING") as logs:
+                results = self.vxlan_manager.validate_many([("192.168.1.1", "peer.example", 1001), ("192.168.1.1", "no-such-host.invalid", 1002)])
+        self.assertEqual(results, [True, False])
+        # The unresolved endpoint is reported once, as a failed lookup
+        self.assertEqual([record.getMessage() for record in logs.records], ["Failed to resolve VNI 1002 endpoint no-such-host.invalid: [Errno -2] Name or service not known"])
+        mock_probe_many.assert_called_once_with([(socket.AF_INET, ("10.0.0.2", 4789))], [b"\x08\x00\x00\x00\x00\x03\xe9\x00"], 3, ["192.168.1.1"])
+
+    def test_validate_unresolvable_host(self):
+        with patch.object(socket, "getaddrinfo", side_effect=socket.gaierror):
+            with self.assertRaises(TunnelManagerError):
+                self.vxlan_manager.validate("192.168.1.1", "no-such-host.invalid", 1001)
+
+    @patch.object(select, "select", return_value=([], [], []))
+    @patch.object(socket, "socket")
+    def test_validate_geneve_connectivity_success(self, mock_socket, mock_select):
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
         self.geneve_manager.validate("192.168.1.1", "192.168.1.2", 1001)
-        mock_socket_instance.connect.assert_called_with(("192.168.1.2", 6081))
+        mock_socket_instance.connect_ex.assert_called_with(("192.168.1.2", 6081))
+        # A Geneve header carrying Ethernet, VNI 1001
+        mock_socket_instance.send.assert_called_once_with(b"\x00\x00\x65\x58\x00\x03\xe9\x00")
 
-    @patch("tunnel_manager.socket.socket")
+    @patch.object(socket, "socket")
     def test_validate_geneve_connectivity_failure(self, mock_socket):
-        mock_socket_instance = mock_socket.return_value.__enter__.return_value
-        mock_socket_instance.connect.side_effect = socket.error
+        mock_socket_instance = mock_socket.return_value
+        mock_socket_instance.connect_ex.return_value = 0
+        mock_socket_instance.send.side_effect = OSError(errno.ENETUNREACH, "Network is unreachable")
         with self.assertRaises(TunnelManagerError):
             self.geneve_manager.validate("192.168.1.1", "192.168.1.2", 1001)
 
+
+class TestNetlinkSocket(unittest.TestCase):
+    @patch.object(tunnel_manager, "_nl", None)
+    @patch.object(tunnel_manager, "IPRoute")
+    def test_shared_socket_caps_acks(self, mock_iproute):
+        nl = tunnel_manager._netlink()
+        self.assertIs(nl, tunnel_manager._netlink())
+        mock_iproute.assert_called_once_with(rcvsize=tunnel_manager.NETLINK_RECV_SIZE)
+        nl.setsockopt.assert_called_once_with(tunnel_manager.SOL_NETLINK, tunnel_manager.NETLINK_CAP_ACK, 1)
+
+    @patch.object(tunnel_manager, "_nl", None)
+    @patch.object(tunnel_manager, "IPRoute", None)
+    def test_no_pyroute2(self):
+        self.assertIsNone(tunnel_manager._netlink())
+
+    @patch.object(tunnel_manager, "_nl_events", None)
+    @patch.object(tunnel_manager, "_nl", None)
+    @patch.object(tunnel_manager, "IPRoute")
+    def test_close_netlink(self, mock_iproute):
+        nl = tunnel_manager._netlink()
+        tunnel_manager._close_netlink()
+        nl.close.assert_called_once_with()
+        self.assertIsNone(tunnel_manager._nl)
+
+
+def _nlmsg(**attrs):
+    msg = MagicMock()
+    msg.get_attr.side_effect = attrs.get
+    msg.__getitem__.side_effect = {"attrs": [[name, value] for name, value in attrs.items()]}.__getitem__
+    return msg
+
+
+class TestNetlinkTunnelManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.vxlan_manager = TunnelManager(TunnelType.VXLAN)
+        cls.geneve_manager = TunnelManager(TunnelType.GENEVE)
+
+    def setUp(self):
+        self.nl = MagicMock()
+        self.nl.link_lookup.side_effect = lambda ifname: [{"eth0": 2, "br0": 3, "vxlan1001": 7, "geneve1001": 8}[ifname]]
+        netlink_patcher = patch.object(tunnel_manager, "_netlink", return_value=self.nl)
+        netlink_patcher.start()
+        self.addCleanup(netlink_patcher.stop)
+        cache_patcher = patch.dict(tunnel_manager._ifindex_cache, clear=True)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        listings_patcher = patch.dict(tunnel_manager._listings, clear=True)
+        listings_patcher.start()
+        self.addCleanup(listings_patcher.stop)
+        # Netlink stands in for every command, so none should run
+        run_patcher = patch.object(subprocess, "run", return_value=subprocess.CompletedProcess([], 0, stdout=b"", stderr=b""))
+        self.mock_run = run_patcher.start()
+        self.addCleanup(run_patcher.stop)
+        events_patcher = patch.object(tunnel_manager, "_drain_link_events")
+        events_patcher.start()
+        self.addCleanup(events_patcher.stop)
+        # Dump requests are built as plain dicts so their attributes can be asserted on
+        msg_patcher = patch.object(tunnel_manager, "ifinfmsg", dict)
+        msg_patcher.start()
+        self.addCleanup(msg_patcher.stop)
+
+    def test_create_vxlan_interface_success(self):
+        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0", dev="eth0")
+        self.nl.link.assert_called_once_with("add", ifname="vxlan1001", kind="vxlan", vxlan_id=1001, vxlan_local="192.168.1.1", vxlan_group="192.168.1.2", vxlan_port=4789, state="up", master=3, vxlan_link=2)
+        self.mock_run.assert_not_called()
+
+    def test_create_vxlan_interface_failure(self):
+        self.nl.link.side_effect = NetlinkError(17)
+        with self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+
+    def test_create_geneve_interface_success(self):
+        self.geneve_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        self.nl.link.assert_called_once_with("add", ifname="geneve1001", kind="geneve", geneve_id=1001, geneve_remote="192.168.1.2", geneve_port=6081, state="up", master=3)
+
+    def test_create_vxlan_interface_ipv6(self):
+        self.vxlan_manager.create(1001, "2001:db8::1", "2001:db8::2", "br0")
+        self.nl.link.assert_called_once_with("add", ifname="vxlan1001", kind="vxlan", vxlan_id=1001, vxlan_local6="2001:db8::1", vxlan_group6="2001:db8::2", vxlan_port=4789, state="up", master=3)
+
+    def test_create_geneve_interface_ipv6(self):
+        self.geneve_manager.create(1001, "2001:db8::1", "2001:db8::2", "br0")
+        self.nl.link.assert_called_once_with("add", ifname="geneve1001", kind="geneve", geneve_id=1001, geneve_remote6="2001:db8::2", geneve_port=6081, state="up", master=3)
+
+    def test_create_many_uses_socket_pool(self):
+        pooled = []
+
+        def open_netlink():
+            sock = MagicMock()
+            sock.link_lookup.side_effect = self.nl.link_lookup.side_effect
+            pooled.append(sock)
+            return sock
+
+        specs = [{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0", "dev": "eth0"} for vni in range(1001, 1011)]
+        with patch.object(tunnel_manager, "_open_netlink", side_effect=open_netlink):
+            self.vxlan_manager.create_many(specs)
+        self.assertEqual(len(pooled), tunnel_manager._NETLINK_WORKERS - 1)
+        # The bridge and device are looked up once for the batch, before any worker starts
+        self.assertEqual(sorted(c.kwargs["ifname"] for c in self.nl.link_lookup.call_args_list), ["br0", "eth0"])
+        for sock in pooled:
+            sock.link_lookup.assert_not_called()
+        created = [c.kwargs["ifname"] for sock in (self.nl, *pooled) for c in sock.link.call_args_list]
+        self.assertEqual(sorted(created), [f"vxlan{vni}" for vni in range(1001, 1011)])
+        # The shared socket stays open; the ones opened for the batch do not
+        self.nl.close.assert_not_called()
+        for sock in pooled:
+            sock.close.assert_called_once_with()
+        # Link notifications are read once for the batch, not before every link
+        tunnel_manager._drain_link_events.assert_called_once_with()
+
+    def test_cleanup_many_uses_socket_pool(self):
+        pooled = [MagicMock() for _ in range(tunnel_manager._NETLINK_WORKERS - 1)]
+        with patch.object(tunnel_manager, "_open_netlink", side_effect=pooled):
+            self.geneve_manager.cleanup_many([{"vni": vni, "bridge_name": "br0"} for vni in range(1001, 1011)])
+        deleted = [c.kwargs["ifname"] for sock in (self.nl, *pooled) for c in sock.link.call_args_list]
+        self.assertEqual(sorted(deleted), [f"geneve{vni}" for vni in range(1001, 1011)])
+        for sock in pooled:
+            sock.close.assert_called_once_with()
+        self.mock_run.assert_not_called()
+
+    def test_create_many_pool_failure(self):
+        self.nl.link.side_effect = NetlinkError(17, "File exists")
+        specs = [{"vni": vni, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"} for vni in (1001, 1002)]
+        with patch.object(tunnel_manager, "_open_netlink", return_value=self.nl), self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.create_many(specs)
+
+    def test_context_manager_closes_shared_socket(self):
+        with patch.object(tunnel_manager, "_close_netlink") as mock_close:
+            with TunnelManager(TunnelType.VXLAN) as manager:
+                manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+                mock_close.assert_not_called()
+        mock_close.assert_called_once_with()
+
+    def test_context_manager_keeps_socket_for_other_managers(self):
+        with patch.object(tunnel_manager, "_close_netlink") as mock_close:
+            with TunnelManager(TunnelType.VXLAN):
+                with TunnelManager(TunnelType.GENEVE):
+                    pass
+                mock_close.assert_not_called()
+        mock_close.assert_called_once_with()
+
+    def test_close_forgets_link_indexes(self):
+        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        tunnel_manager._close_netlink()
+        # br0 may be recreated with a new index before the socket is reopened
+        self.vxlan_manager.create(1002, "192.168.1.1", "192.168.1.2", "br0")
+        self.assertEqual(self.nl.link_lookup.call_count, 2)
+
+    def test_bridge_index_cached(self):
+        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        self.vxlan_manager.create(1002, "192.168.1.1", "192.168.1.2", "br0")
+        self.nl.link_lookup.assert_called_once_with(ifname="br0")
+
+    def test_bridge_cache_invalidated_on_failure(self):
+        self.nl.link.side_effect = [NetlinkError(19), None]
+        with self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+        self.assertEqual(self.nl.link_lookup.call_count, 2)
+
+    def test_create_missing_bridge(self):
+        self.nl.link_lookup.side_effect = lambda ifname: []
+        with self.assertRaises(TunnelManagerError):
+            self.vxlan_manager.create(1001, "192.168.1.1", "192.168.1.2", "br0")
+
+    def test_cleanup_vxlan_interface_success(self):
+        self.vxlan_manager.cleanup(1001, "br0")
+        self.nl.link.assert_called_once_with("del", ifname="vxlan1001")
+        self.nl.link_lookup.assert_not_called()
+        self.mock_run.assert_not_called()
+
+    def test_list_vxlan_interfaces(self):
+        vxlan_info = _nlmsg(IFLA_VXLAN_ID=1001, IFLA_VXLAN_LOCAL="192.168.1.1", IFLA_VXLAN_GROUP="192.168.1.2", IFLA_VXLAN_TTL=64, IFLA_VXLAN_PORT=4789)
+        self.nl.nlm_request.return_value = [
+            _nlmsg(IFLA_IFNAME="lo"),
+            _nlmsg(IFLA_IFNAME="geneve7", IFLA_LINKINFO=_nlmsg(IFLA_INFO_KIND="geneve", IFLA_INFO_DATA=_nlmsg())),
+            _nlmsg(IFLA_IFNAME="vxlan1001", IFLA_LINKINFO=_nlmsg(IFLA_INFO_KIND="vxlan", IFLA_INFO_DATA=vxlan_info)),
+        ]
+        links = list(tunnel_manager._tunnel_links(self.nl, "vxlan", frozenset({"IFLA_VXLAN_ID"})))
+        # Attributes no listing field reads are not copied out of the message
+        self.assertEqual(links, [("vxlan1001", {"IFLA_VXLAN_ID": 1001})])
+        self.nl.nlm_request.reset_mock()
+        self.assertEqual(self.vxlan_manager.list(), [{"ifname": "vxlan1001", "vni": "1001", "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "dst_port": "4789"}])
+        vxlan_info.get_attr.assert_not_called()
+        # The dump asks the kernel for vxlan links only
+        self.nl.nlm_request.assert_called_once_with({"attrs": [("IFLA_LINKINFO", {"attrs": [("IFLA_INFO_KIND", "vxlan")]})]}, msg_type=18, msg_flags=0x301)
+
+    def test_list_reuses_dump_until_links_change(self):
+        self.nl.nlm_request.return_value = [_nlmsg(IFLA_IFNAME="vxlan7", IFLA_LINKINFO=_nlmsg(IFLA_INFO_KIND="vxlan", IFLA_INFO_DATA=_nlmsg(IFLA_VXLAN_ID=7)))]
+        first = self.vxlan_manager.list()
+        first[0]["vni"] = "8"
+        self.assertEqual(self.vxlan_manager.list(), [{"ifname": "vxlan7", "vni": "7"}])
+        self.nl.nlm_request.assert_called_once()
+        with patch.object(tunnel_manager, "_link_generation", tunnel_manager._link_generation + 1):
+            self.vxlan_manager.list()
+        self.assertEqual(self.nl.nlm_request.call_count, 2)
+
+    def test_list_dump_shared_across_managers(self):
+        self.nl.nlm_request.return_value = [_nlmsg(IFLA_IFNAME="vxlan7", IFLA_LINKINFO=_nlmsg(IFLA_INFO_KIND="vxlan", IFLA_INFO_DATA=_nlmsg(IFLA_VXLAN_ID=7)))]
+        self.vxlan_manager.list()
+        self.assertEqual(TunnelManager(TunnelType.VXLAN).list(), [{"ifname": "vxlan7", "vni": "7"}])
+        self.nl.nlm_request.assert_called_once()
+
+    def test_list_geneve_interfaces_ipv6(self):
+        geneve_info = _nlmsg(IFLA_GENEVE_ID=1001, IFLA_GENEVE_REMOTE6="2001:db8::2", IFLA_GENEVE_PORT=6081)
+        self.nl.nlm_request.return_value = [_nlmsg(IFLA_IFNAME="geneve1001", IFLA_LINKINFO=_nlmsg(IFLA_INFO_KIND="geneve", IFLA_INFO_DATA=geneve_info))]
+        self.assertEqual(self.geneve_manager.list(), [{"ifname": "geneve1001", "vni": "1001", "dst_host": "2001:db8::2", "dst_port": "6081"}])
+
+    def test_cleanup_geneve_interface_failure(self):
+        self.nl.link.side_effect = NetlinkError(19)
+        with self.assertRaises(TunnelManagerError):
+            self.geneve_manager.cleanup(1001, "br0")
+
+
+def _link_event(event, index, ifname):
+    msg = _nlmsg(IFLA_IFNAME=ifname)
+    msg.__getitem__.side_effect = {"event": event, "index": index}.__getitem__
+    return msg
+
+
+class TestLinkEvents(unittest.TestCase):
+    def test_link_events_evict_cached_indexes(self):
+        events = MagicMock()
+        events.get.return_value = [_link_event("RTM_NEWLINK", 3, "br0"), _link_event("RTM_NEWLINK", 12, "eth0"), _link_event("RTM_DELLINK", 4, "br1")]
+        with patch.dict(tunnel_manager._ifindex_cache, {"br0": 3, "eth0": 2, "br1": 4, "br2": 5}, clear=True), patch.object(tunnel_manager, "_nl_events", events), patch.object(select, "select", side_effect=[([events], [], []), ([], [], [])]), patch.object(tunnel_manager, "_link_generation", 0):
+            tunnel_manager._drain_link_events()
+            # br0 only changed state; eth0 was recreated under a new index and br1 deleted
+            self.assertEqual(tunnel_manager._ifindex_cache, {"br0": 3, "br2": 5})
+            self.assertEqual(tunnel_manager._link_generation, 1)
+
+    def test_link_event_overflow_forgets_cached_indexes(self):
+        events = MagicMock()
+        events.get.side_effect = [OSError(errno.ENOBUFS, "No buffer space available"), [_link_event("RTM_NEWLINK", 3, "br0")]]
+        with patch.dict(tunnel_manager._ifindex_cache, {"br0": 3, "eth0": 2}, clear=True), patch.object(tunnel_manager, "_nl_events", events), patch.object(select, "select", side_effect=[([events], [], []), ([events], [], []), ([], [], [])]), patch.object(tunnel_manager, "_link_generation", 0):
+            tunnel_manager._drain_link_events()
+            self.assertEqual(tunnel_manager._ifindex_cache, {})
+            self.assertEqual(tunnel_manager._link_generation, 2)
+
+
+class TestSystemCommandValidator(unittest.TestCase):
+    def setUp(self):
+        tunnel_manager._which.cache_clear()
+
+    def test_command_lookup_cached_per_path(self):
+        validator = tunnel_manager.SystemCommandValidator()
+        with patch.object(shutil, "which", return_value="/usr/sbin/ip") as mock_which, patch.dict(os.environ, {"PATH": "/usr/sbin"}):
+            self.assertTrue(validator.check_command_existence("ip"))
+            self.assertTrue(validator.check_command_existence("ip"))
+            mock_which.assert_called_once_with("ip", path="/usr/sbin")
+            os.environ["PATH"] = "/sbin"
+            self.assertTrue(validator.check_command_existence("ip"))
+            self.assertEqual(mock_which.call_count, 2)
+
+    def test_missing_bridge_tool(self):
+        with patch.object(shutil, "which", return_value=None):
+            with self.assertRaises(RuntimeError):
+                tunnel_manager.SystemCommandValidator().check_bridge_tool_existence("brctl")
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        tool_patcher = patch.object(tunnel_manager.SystemCommandValidator, "check_bridge_tool_existence")
+        tool_patcher.start()
+        self.addCleanup(tool_patcher.stop)
+
+    def test_validate_passes_port(self):
+        with patch.object(TunnelManager, "validate") as mock_validate:
+            tunnel_manager.main(["validate", "--src-host", "192.168.1.1", "--dst-host", "192.168.1.2", "--vni", "1001", "--port", "8472"])
+        mock_validate.assert_called_once_with("192.168.1.1", "192.168.1.2", 1001, 8472, 3, 3)
+
+    def test_validate_hosts_file(self):
+        hosts = "# peers\n192.168.1.1 192.168.1.2 1001\n\n192.168.1.1 192.168.1.3 1002\n"
+        with patch("builtins.open", mock_open(read_data=hosts)), patch.object(TunnelManager, "validate_many", return_value=[True, False]) as mock_validate_many:
+            with self.assertRaises(SystemExit):
+                tunnel_manager.main(["validate", "--hosts-file", "peers.txt", "--timeout", "1"])
+        mock_validate_many.assert_called_once_with([("192.168.1.1", "192.168.1.2", 1001), ("192.168.1.1", "192.168.1.3", 1002)], None, 1, 3)
+
+    def test_validate_hosts_file_rejects_malformed_lines(self):
+        for line in ("192.168.1.1 192.168.1.3", "192.168.1.1 192.168.1.3 vni7"):
+            with self.subTest(line=line), patch("builtins.open", mock_open(read_data=f"192.168.1.1 192.168.1.2 1001\n{line}\n")), patch.object(TunnelManager, "validate_many") as mock_validate_many:
+                with self.assertLogs(tunnel_manager.logger, "ERROR") as logs, self.assertRaises(SystemExit):
+                    tunnel_manager.main(["validate", "--hosts-file", "peers.txt"])
+                self.assertIn("peers.txt:2: expected 'src_host dst_host vni'", logs.output[0])
+                mock_validate_many.assert_not_called()
+
+    def test_create_spec_file(self):
+        specs = b'[{"vni": 1001, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"}, {"vni": 1002, "src_host": "192.168.1.1", "dst_host": "192.168.1.3", "bridge_name": "br0", "dst_port": 8472}]'
+        with patch("builtins.open", mock_open(read_data=specs)), patch.object(TunnelManager, "create_many") as mock_create_many:
+            tunnel_manager.main(["create", "--spec-file", "tunnels.json"])
+        mock_create_many.assert_called_once_with(
+            [{"vni": 1001, "src_host": "192.168.1.1", "dst_host": "192.168.1.2", "bridge_name": "br0"}, {"vni": 1002, "src_host": "192.168.1.1", "dst_host": "192.168.1.3", "bridge_name": "br0", "dst_port": 8472}]
+        )
+
+    def test_create_spec_file_rejects_unknown_keys(self):
+        with patch("builtins.open", mock_open(read_data=b'[{"vni": 1001, "src_host": "a", "dst_host": "b", "bridge_name": "br0", "ttl": 4}]')), patch.object(TunnelManager, "create_many") as mock_create_many:
+            with self.assertLogs(tunnel_manager.logger, "ERROR"), self.assertRaises(SystemExit):
+                tunnel_manager.main(["create", "--spec-file", "tunnels.json"])
+        mock_create_many.assert_not_called()
+
+    def test_create_spec_file_rejects_wrong_types(self):
+        for spec in (b'{"vni": "1001", "src_host": "a", "dst_host": "b", "bridge_name": "br0"}', b'{"vni": 1001, "src_host": "a", "dst_host": "b", "bridge_name": "br0", "dst_port": "4789"}', b'{"vni": 1001, "src_host": "a", "dst_host": 2, "bridge_name": "br0"}'):
+            with self.subTest(spec=spec), patch("builtins.open", mock_open(read_data=b"[" + spec + b"]")), patch.object(TunnelManager, "create_many") as mock_create_many:
+                with self.assertLogs(tunnel_manager.logger, "ERROR") as logs, self.assertRaises(SystemExit):
+                    tunnel_manager.main(["create", "--spec-file", "tunnels.json"])
+                self.assertIn("tunnels.json: spec 0", logs.output[0])
+                mock_create_many.assert_not_called()
+
+    def test_create_requires_tunnel(self):
+        with patch.object(sys, "stderr", io.StringIO()), self.assertRaises(SystemExit):
+            tunnel_manager.main(["create", "--vni", "1001"])
+
+    def test_errors_exit_nonzero(self):
+        with patch.object(TunnelManager, "cleanup", side_effect=TunnelManagerError("Error deleting VXLAN interface for VNI 1001")):
+            with self.assertLogs(tunnel_manager.logger, "ERROR") as logs, self.assertRaises(SystemExit) as exit_info:
+                tunnel_manager.main(["cleanup", "--vni", "1001", "--bridge-name", "br0"])
+        self.assertEqual(exit_info.exception.code, 1)
+        self.assertEqual(logs.records[0].getMessage(), "Error deleting VXLAN interface for VNI 1001")
+
+    def test_validate_requires_target(self):
+        with patch.object(sys, "stderr", io.StringIO()), self.assertRaises(SystemExit):
+            tunnel_manager.main(["validate", "--src-host", "192.168.1.1"])
+
+    def test_list_csv(self):
+        with patch.object(TunnelManager, "list", return_value=[{"ifname": "vxlan7", "vni": "7"}]), patch.object(sys, "stdout", io.StringIO()) as stdout:
+            tunnel_manager.main(["--tunnel-type", "vxlan", "list", "-fo", "csv"])
+        self.assertEqual(stdout.getvalue().splitlines(), ["ifname,vni", "vxlan7,7"])
+
+    def test_list_fields(self):
+        links = [{"ifname": "vxlan7", "vni": "7", "dst_host": "239.1.1.1"}, {"ifname": "vxlan8", "vni": "8", "src_host": "10.0.0.1"}]
+        with patch.object(TunnelManager, "list", return_value=links), patch.object(sys, "stdout", io.StringIO()) as stdout:
+            tunnel_manager.main(["--tunnel-type", "vxlan", "list", "-fo", "csv", "--fields", "vni", "ifname"])
+        self.assertEqual(stdout.getvalue().splitlines(), ["vni,ifname", "7,vxlan7", "8,vxlan8"])
+
+    def test_select_fields_drops_unknown_names(self):
+        links = [{"ifname": "vxlan7", "vni": "7"}]
+        self.assertEqual(tunnel_manager._select_fields(links, ["vni", "__class__", "vni"]), [{"vni": "7"}])
+        self.assertEqual(tunnel_manager._select_fields(links, ["src_host", "vni", "vni", "bogus"]), [{"vni": "7"}])
+
+    def test_list_rejects_unknown_fields(self):
+        with patch.object(TunnelManager, "list") as mock_list, patch.object(sys, "stderr", io.StringIO()) as stderr, self.assertRaises(SystemExit):
+            tunnel_manager.main(["list", "--fields", "vin"])
+        self.assertIn("invalid choice: 'vin'", stderr.getvalue())
+        mock_list.assert_not_called()
+
+    def test_only_selected_command_gets_arguments(self):
+        with patch.dict(tunnel_manager._COMMANDS, create=("create a tunnel interface", MagicMock())) as commands:
+            tunnel_manager._build_parser(["list"])
+            commands["create"][1].assert_not_called()
+
+
+class TestOutputFormatters(unittest.TestCase):
+    data = [{"ifname": "vxlan1001", "vni": "1001"}, {"ifname": "vxlan7", "vni": "7"}]
+
+    def test_format_table(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.TABLE).format(self.data)
+        self.assertEqual(output.splitlines(), ["ifname    | vni ", "----------+-----", "vxlan1001 | 1001", "vxlan7    | 7   "])
+
+    def test_format_table_rows_with_unset_fields(self):
+        # A multicast VXLAN listed first has no local address; the column still appears for the rows that do
+        rows = [{"ifname": "vxlan9", "vni": "9", "dst_host": "239.1.1.1"}, {"ifname": "vxlan1001", "vni": "1001", "src_host": "192.168.1.1", "dst_host": "192.168.1.2"}]
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.TABLE).format(rows)
+        self.assertEqual(output.splitlines(), ["ifname    | vni  | dst_host    | src_host   ", "----------+------+-------------+------------", "vxlan9    | 9    | 239.1.1.1   |            ", "vxlan1001 | 1001 | 192.168.1.2 | 192.168.1.1"])
+
+    def test_format_csv(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.CSV).format(self.data)
+        self.assertEqual(output.splitlines(), ["ifname,vni", "vxlan1001,1001", "vxlan7,7"])
+
+    def test_write_csv_to_stream(self):
+        stream = io.StringIO()
+        OutputFormatterFactory.get_formatter(OutputFormatType.CSV).write(self.data, stream)
+        self.assertEqual(stream.getvalue().splitlines(), ["ifname,vni", "vxlan1001,1001", "vxlan7,7"])
+
+    def test_write_csv_flushes_line_buffered_stream_once(self):
+        class RecordingBytesIO(io.BytesIO):
+            def write(self, b):
+                writes.append(bytes(b))
+                return super().write(b)
+
+        writes = []
+        stream = io.TextIOWrapper(RecordingBytesIO(), encoding="ascii", line_buffering=True)
+        # The comma forces the quoting csv.writer path, which hands over one row at a time
+        OutputFormatterFactory.get_formatter(OutputFormatType.CSV).write(self.data + [{"ifname": "a,b", "vni": "1"}], stream)
+        self.assertTrue(stream.line_buffering)
+        self.assertEqual(writes, [b'ifname,vni\r\nvxlan1001,1001\r\nvxlan7,7\r\n"a,b",1\r\n'])
+
+    def test_format_csv_quotes_like_csv_module(self):
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.CSV)
+        for rows in (self.data, [{"a": 'x"y', "b": "1"}], [{"a": "x\ny", "b": ""}], [{"a": "", "b": ""}], [{"a": 1, "b": None}], [{"a": ""}]):
+            expected = io.StringIO()
+            writer = csv.DictWriter(expected, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+            self.assertEqual(formatter.format(rows), expected.getvalue())
+
+    def test_format_csv_rows_with_unset_fields(self):
+        # A multicast VXLAN has no local address, and it may come first
+        rows = [{"ifname": "vxlan9", "vni": "9", "dst_host": "239.1.1.1"}, {"ifname": "vxlan1001", "vni": "1001", "src_host": "192.168.1.1", "dst_host": "192.168.1.2"}]
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.CSV)
+        expected = ["ifname,vni,dst_host,src_host", "vxlan9,9,239.1.1.1,", "vxlan1001,1001,192.168.1.2,192.168.1.1"]
+        self.assertEqual(formatter.format(rows).splitlines(), expected)
+        # The quoting csv.writer path fills the same gaps
+        self.assertEqual(formatter.format(rows + [{"ifname": "a,b"}]).splitlines(), expected + ['"a,b",,,'])
+
+    def test_format_csv_rows_without_fields(self):
+        # Geneve rows never carry src_host, so selecting only it leaves every row empty
+        rows = tunnel_manager._select_fields([{"ifname": "geneve1001", "vni": "1001"}, {"ifname": "geneve1002", "vni": "1002"}], ["src_host"])
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.CSV)
+        self.assertEqual(formatter.format(rows), "\r\n" * 3)
+        stream = io.StringIO()
+        formatter.write(rows, stream)
+        self.assertEqual(stream.getvalue(), "\r\n" * 3)
+
+    def test_list_csv_mixed_links(self):
+        with patch.object(tunnel_manager, "_netlink", return_value=None), patch.dict(tunnel_manager._listings, clear=True):
+            with patch.object(subprocess, "run", return_value=subprocess.CompletedProcess([], 0, stdout=IP_LINK_SHOW_VXLAN, stderr=b"")), patch.object(sys, "stdout", io.StringIO()) as stdout:
+                tunnel_manager.main(["--tunnel-type", "vxlan", "list", "-fo", "csv"])
+        self.assertEqual(len(stdout.getvalue().splitlines()), 3)
+
+    def test_format_csv_quoted_documents_are_independent(self):
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.CSV)
+        self.assertEqual(formatter.format([{"a": "x,y", "b": "long value"}]), 'a,b\r\n"x,y",long value\r\n')
+        # A shorter document leaves nothing of the previous one behind
+        self.assertEqual(formatter.format([{"a": "x,y", "b": ""}]), 'a,b\r\n"x,y",\r\n')
+
+    def test_write_falls_back_to_format(self):
+        stream = io.StringIO()
+        OutputFormatterFactory.get_formatter(OutputFormatType.SCRIPT).write(self.data, stream)
+        self.assertEqual(stream.getvalue(), "ifname: vxlan1001, vni: 1001, ifname: vxlan7, vni: 7\n")
+
+    def test_write_encodes_to_binary_buffer(self):
+        stream = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        stream.write("vxlan:\n")
+        OutputFormatterFactory.get_formatter(OutputFormatType.SCRIPT).write([{"ifname": "vxlan\u00e9"}], stream)
+        stream.flush()
+        self.assertEqual(stream.buffer.getvalue().decode("utf-8"), "vxlan:\nifname: vxlan\u00e9\n")
+
+    def test_format_csv_single_field(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.CSV).format([{"ifname": "vxlan1001"}])
+        self.assertEqual(output.splitlines(), ["ifname", "vxlan1001"])
+
+    def test_format_json(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.JSON).format(self.data)
+        self.assertEqual(output, json.dumps(self.data, indent=2))
+        self.assertEqual(tunnel_manager._stdlib_json_dumps(self.data), output)
+
+    @unittest.skipIf(tunnel_manager.orjson is None, "orjson is not installed")
+    def test_write_json_bytes_to_binary_buffer(self):
+        stream = io.TextIOWrapper(io.BytesIO(), encoding="ascii")
+        OutputFormatterFactory.get_formatter(OutputFormatType.JSON).write([{"ifname": "vxlan\u00e9"}], stream)
+        self.assertEqual(json.loads(stream.buffer.getvalue().decode("utf-8")), [{"ifname": "vxlan\u00e9"}])
+        self.assertTrue(stream.buffer.getvalue().endswith(b"]\n"))
+
+    @unittest.skipIf(tunnel_manager.orjson is None, "orjson is not installed")
+    def test_format_json_orjson_layout(self):
+        data = self.data + [{"ifname": "vxlan8", "vni": 8, "ports": [4789, None], "extra": {}}]
+        self.assertEqual(tunnel_manager._orjson_dumps(data), tunnel_manager._stdlib_json_dumps(data))
+
+    def test_format_yaml_keeps_field_order(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.YAML).format([{"vni": "7", "ifname": "vxlan7"}])
+        self.assertEqual(output.splitlines(), ["- vni: '7'", "  ifname: vxlan7"])
+
+    def test_write_yaml_to_stream(self):
+        stream = io.StringIO()
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.YAML)
+        formatter.write(self.data, stream)
+        self.assertEqual(stream.getvalue(), formatter.format(self.data))
+
+    def test_format_xml(self):
+        output = OutputFormatterFactory.get_formatter(OutputFormatType.XML).format(self.data + [{"ifname": "a<b", "vni": 1}])
+        root = ElementTree.fromstring(output)
+        self.assertEqual(root.tag, "TunnelInterfaces")
+        self.assertEqual([[(field.tag, field.text) for field in interface] for interface in root], [[("ifname", "vxlan1001"), ("vni", "1001")], [("ifname", "vxlan7"), ("vni", "7")], [("ifname", "a<b"), ("vni", "1")]])
+
+    def test_write_xml_to_stream(self):
+        stream = io.StringIO()
+        formatter = OutputFormatterFactory.get_formatter(OutputFormatType.XML)
+        formatter.write(self.data, stream)
+        self.assertEqual(stream.getvalue(), formatter.format(self.data) + "\n")
+
+    def test_write_xml_in_batches(self):
+        stream = MagicMock()
+        with patch.object(tunnel_manager, "_XML_WRITE_BATCH", 2):
+            OutputFormatterFactory.get_formatter(OutputFormatType.XML).write(self.data, stream)
+        # Opening tag and first row, second row and closing tag, then the newline
+        self.assertEqual(stream.write.call_count, 3)
+        self.assertEqual("".join(c.args[0] for c in stream.write.call_args_list), OutputFormatterFactory.get_formatter(OutputFormatType.XML).format(self.data) + "\n")
+
+    def test_format_xml_rejects_invalid_names(self):
+        with self.assertRaises(ValueError):
+            OutputFormatterFactory.get_formatter(OutputFormatType.XML).format([{"bad name": "x"}])
+
+    def test_get_formatter_covers_every_format(self):
+        for format_type in OutputFormatType:
+            self.assertIs(OutputFormatterFactory.get_formatter(format_type), OutputFormatterFactory.get_by_name(format_type.value))
+
+    def test_get_by_name(self):
+        self.assertIs(OutputFormatterFactory.get_by_name("csv"), OutputFormatterFactory.get_formatter(OutputFormatType.CSV))
+        with self.assertRaises(ValueError):
+            OutputFormatterFactory.get_by_name("html")
+
+    def test_format_table_empty(self):
+        self.assertEqual(OutputFormatterFactory.get_formatter(OutputFormatType.TABLE).format([]), "")
+
+
 if __name__ == "__main__":
     unittest.main()
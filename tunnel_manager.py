@@ -1,19 +1,56 @@
 import argparse
+import atexit
+import concurrent.futures
+import contextlib
 import csv
+import errno
+import functools
 import io
+import itertools
 import json
 import logging
+import operator
+import os
+import queue
 import re
+import select
+import selectors
+import shlex
 import shutil
 import socket
+import struct
 import subprocess
 import sys
+import threading
+import time
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Dict, List, Optional, Protocol, Type
-from xml.etree import ElementTree
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Protocol, TextIO, Tuple, Type, Union
+from xml.sax.saxutils import escape
 
 import yaml
 
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Both accept the raw bytes ip writes
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+try:
+    from pyroute2 import IPRoute, NetlinkError
+    from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+except ImportError:
+    IPRoute = None
+    NetlinkError = OSError
+    ifinfmsg = None
+
 # Configure logging with timestamps
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -25,171 +62,716 @@ class TunnelManagerError(Exception):
     pass
 
 
-class TunnelInterface(Protocol):
-    ip_pattern = r"(?:\d{1,3}(?:\.\d{1,3}){3}|[a-fA-F0-9:]+(?::\d{1,3}(?:\.\d{1,3}){3})?)"
+# Probe sockets are created non-blocking where socket() supports it
+_SOCK_NONBLOCK = getattr(socket, "SOCK_NONBLOCK", 0)
+# VXLAN and Geneve run over UDP, so a probe is one encapsulation header sent to the tunnel port
+_PROBE_SOCK_TYPE = socket.SOCK_DGRAM | _SOCK_NONBLOCK
+# A closed port or unreachable host answers with ICMP within a round trip; a probe nothing rejected
+# for this long has passed, however long the caller's timeout
+_PROBE_REJECT_WAIT = 0.5
 
-    def create_tunnel_interface(self, vni: int, src_host: str, dst_host: str, bridge_name: str, src_port: Optional[int] = None, dst_port: Optional[int] = None, dev: Optional[str] = "eth0") -> None:
-        raise NotImplementedError
 
-    def cleanup_tunnel_interface(self, vni: int, bridge_name: str) -> None:
-        raise NotImplementedError
+@functools.lru_cache(maxsize=1024)
+def _resolve(host: str, port: int) -> Tuple[Tuple[int, Tuple[Any, ...]], ...]:
+    """Resolve a probe target to its distinct (family, sockaddr) pairs, in getaddrinfo's order, once per host and port."""
+    return tuple(dict.fromkeys((family, sockaddr) for family, _, _, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)))
 
-    def validate_connectivity(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
-        raise NotImplementedError
 
-    def collect_tunnel_data(self) -> List[Dict[str, Any]]:
-        raise NotImplementedError
+# Pause before the first retry of a failed probe, doubling per retry up to the cap
+_RETRY_DELAY = 0.1
+_RETRY_DELAY_MAX = 1.0
 
 
-# VXLAN-specific tunnel
-class VXLANTunnel(TunnelInterface):
-    DEFAULT_PORT = 4789
+def _retry_delays(deadline: float) -> Iterator[float]:
+    """Yield the pause before each retry, stopping once the next would run past the monotonic `deadline`."""
+    delay = _RETRY_DELAY
+    while delay < deadline - time.monotonic():
+        yield delay
+        delay = min(delay * 2, _RETRY_DELAY_MAX)
 
-    def __init__(self, bridge_tool: str = "ip") -> None:
-        self.bridge_tool = bridge_tool
-        self.tunnel_type = "vxlan"
 
-    def create_tunnel_interface(self, vni: int, src_host: str, dst_host: str, bridge_name: str, src_port: Optional[int] = None, dst_port: Optional[int] = None, dev: Optional[str] = "eth0") -> None:
-        src_port = src_port or self.DEFAULT_PORT
-        dst_port = dst_port or self.DEFAULT_PORT
+# getaddrinfo blocks for a whole DNS round trip, so distinct hosts are looked up on a few threads at once
+_RESOLVE_WORKERS = 16
 
+
+def _resolve_many(hosts: List[str], port: int) -> Dict[str, Union[Tuple[int, Tuple[Any, ...]], socket.gaierror]]:
+    """Resolve each distinct host concurrently, mapping it to its preferred (family, sockaddr) or to its lookup error."""
+
+    def lookup(host: str) -> Union[Tuple[int, Tuple[Any, ...]], socket.gaierror]:
         try:
-            subprocess.run(["ip", "link", "add", f"vxlan{vni}", "type", "vxlan", "id", str(vni), "local", src_host, "remote", dst_host, "dev", dev, "dstport", str(dst_port)], check=True)
-            subprocess.run(["ip", "link", "set", f"vxlan{vni}", "up"], check=True)
-            subprocess.run(["ip", "link", "set", "master", bridge_name, f"vxlan{vni}"], check=True)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error creating VXLAN interface for VNI {vni}: {e}")
-            raise TunnelManagerError(f"Error creating VXLAN interface for VNI {vni}") from e
+            return _resolve(host, port)[0]
+        except socket.gaierror as e:
+            return e
 
-    def cleanup_tunnel_interface(self, vni: int, bridge_name: str) -> None:
+    hosts = list(dict.fromkeys(hosts))
+    if len(hosts) < 2:
+        return {host: lookup(host) for host in hosts}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(hosts), _RESOLVE_WORKERS)) as pool:
+        return dict(zip(hosts, pool.map(lookup, hosts)))
+
+
+@functools.lru_cache(maxsize=256)
+def _is_address(family: int, host: str) -> bool:
+    """Whether `host` is a literal address of the family, rather than a name bind would have to look up."""
+    try:
+        socket.inet_pton(family, host)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _bind_source(s: socket.socket, family: int, source: str) -> None:
+    """Send from `source`, the tunnel's local address, when it is an address of this family that the host owns.
+
+    The probe then leaves the way the tunnel's own packets do; otherwise routing picks the source address.
+    """
+    if _is_address(family, source):
         try:
-            if self.bridge_tool == "brctl":
-                subprocess.run(["brctl", "delif", bridge_name, f"vxlan{vni}"], check=True)
-            else:
-                subprocess.run(["ip", "link", "set", f"vxlan{vni}", "nomaster"], check=True)
+            s.bind((source, 0))
+        except OSError as e:
+            logger.debug("Probing without source address %s: %s", source, e)
+
+
+def _open_probe_socket(family: int, source: Optional[str]) -> socket.socket:
+    s = socket.socket(family, _PROBE_SOCK_TYPE)
+    if not _SOCK_NONBLOCK:
+        s.setblocking(False)
+    if source is not None:
+        _bind_source(s, family, source)
+    return s
+
+
+def _send_probe(family: int, sockaddr: Tuple[Any, ...], payload: bytes, source: Optional[str] = None) -> Tuple[socket.socket, int]:
+    """Send one probe datagram from a new socket; return the socket and 0, or the errno the send failed with."""
+    s = _open_probe_socket(family, source)
+    # Connecting a UDP socket only fixes its peer, which is what lets ICMP errors from that peer reach it
+    err = s.connect_ex(sockaddr)
+    if err == 0:
+        try:
+            s.send(payload)
+        except OSError as e:
+            err = e.errno
+    return s, err
+
+
+def _probe_attempts(addresses: Iterable[Tuple[int, Tuple[Any, ...]]], payload: bytes, timeout: float, source: Optional[str] = None) -> Iterator[int]:
+    """Yield 0 or an errno per probe, forever, each from a new socket to the next of the (family, sockaddr) addresses.
+
+    UDP has no handshake: a probe fails when an ICMP error comes back while it waits, and passes otherwise.
+    """
+    wait = min(timeout, _PROBE_REJECT_WAIT)
+    for family, sockaddr in itertools.cycle(addresses):
+        s, err = _send_probe(family, sockaddr, payload, source)
+        with s:
+            # Readable means an ICMP error is pending or the far end answered; SO_ERROR tells which
+            if err == 0 and select.select([s], [], [], wait)[0]:
+                err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        yield err
+
+
+# Linux queues the ICMP errors an unconnected UDP socket draws when these are set; Python only names them from 3.12
+IP_RECVERR = 11
+IPV6_RECVERR = 25
+_RECVERR = {socket.AF_INET: (socket.IPPROTO_IP, IP_RECVERR), socket.AF_INET6: (socket.IPPROTO_IPV6, IPV6_RECVERR)} if sys.platform.startswith("linux") and hasattr(socket, "MSG_ERRQUEUE") else {}
+# One struct sock_extended_err and the offender's address, at most a sockaddr_in6
+_RECVERR_CMSG_SIZE = socket.CMSG_SPACE(16 + 28) if _RECVERR else 0
+
+
+def _probe_many(targets: List[Tuple[int, Tuple[Any, ...]]], payloads: List[bytes], timeout: float, sources: Optional[List[Optional[str]]] = None) -> List[int]:
+    """Probe every (family, sockaddr) with its payload, from its source if given, at once; return each errno once the wait for rejections ends."""
+    if sources is None:
+        sources = [None] * len(targets)
+    if _RECVERR and all(family in _RECVERR for family, _ in targets):
+        return _probe_many_shared(targets, payloads, timeout, sources)
+    results = [0] * len(targets)
+    with selectors.DefaultSelector() as selector:
+        try:
+            for i, ((family, sockaddr), payload, source) in enumerate(zip(targets, payloads, sources)):
+                s, err = _send_probe(family, sockaddr, payload, source)
+                if err:
+                    results[i] = err
+                    s.close()
+                else:
+                    selector.register(s, selectors.EVENT_READ, i)
+
+            # One wait for the whole batch; the probes still registered when it ends were not rejected
+            deadline = time.monotonic() + min(timeout, _PROBE_REJECT_WAIT)
+            while selector.get_map() and (remaining := deadline - time.monotonic()) > 0:
+                for key, _ in selector.select(remaining):
+                    results[key.data] = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+        finally:
+            for key in list(selector.get_map().values()):
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+    return results
+
+
+def _probe_many_shared(targets: List[Tuple[int, Tuple[Any, ...]]], payloads: List[bytes], timeout: float, sources: List[Optional[str]]) -> List[int]:
+    """_probe_many from one unconnected socket per address family and source, matching queued ICMP errors to targets by address.
+
+    Every target sharing a source, host and port shares its fate, whatever the VNI, so the address alone places an error.
+    """
+    results = [0] * len(targets)
+    by_peer: Dict[Tuple[Any, ...], List[int]] = {}
+    for i, ((family, sockaddr), source) in enumerate(zip(targets, sources)):
+        by_peer.setdefault((family, source, *sockaddr[:2]), []).append(i)
+
+    def drain(key: Tuple[int, Optional[str]], s: socket.socket) -> bool:
+        """Record every queued error and discard any answers; False when there was no error."""
+        drained = False
+        while True:
+            try:
+                _, ancdata, _, sockaddr = s.recvmsg(0, _RECVERR_CMSG_SIZE, socket.MSG_ERRQUEUE)
+            except BlockingIOError:
+                break
+            drained = True
+            for _, _, data in ancdata:
+                (err,) = struct.unpack_from("I", data)
+                for i in by_peer.get((*key, *sockaddr[:2]), ()):
+                    results[i] = err
+        # A peer that answers passes, but its datagram would keep the socket readable until read
+        while True:
+            try:
+                s.recv(1)
+            except OSError:
+                return drained
+
+    sockets: Dict[Tuple[int, Optional[str]], socket.socket] = {}
+    with selectors.DefaultSelector() as selector:
+        try:
+            for i, ((family, sockaddr), payload, source) in enumerate(zip(targets, payloads, sources)):
+                key = (family, source)
+                s = sockets.get(key)
+                if s is None:
+                    s = sockets[key] = _open_probe_socket(family, source)
+                    s.setsockopt(*_RECVERR[family], 1)
+                    selector.register(s, selectors.EVENT_READ, key)
+                # A send also fails with an earlier probe's pending error; that error is taken from the queue and the send retried
+                while True:
+                    try:
+                        s.sendto(payload, sockaddr)
+                        break
+                    except OSError as e:
+                        if not drain(key, s):
+                            results[i] = e.errno
+                            break
+
+            # Waiting ends early once every probe has been rejected
+            deadline = time.monotonic() + min(timeout, _PROBE_REJECT_WAIT)
+            while 0 in results and (remaining := deadline - time.monotonic()) > 0:
+                for selected, _ in selector.select(remaining):
+                    drain(selected.data, selected.fileobj)  # type: ignore[arg-type]
+        finally:
+            for s in sockets.values():
+                selector.unregister(s)
+                s.close()
+    return results
+
+
+# Shared rtnetlink socket, opened on first use and reused for every link operation
+_nl: Optional[Any] = None
+
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10
+RTM_GETLINK = 18
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+# The kernel sizes each dump batch from the reader's buffer, capped at 32 KiB
+NETLINK_RECV_SIZE = 32768
+
+
+def _open_netlink() -> Any:
+    """Open an rtnetlink socket sized for link dumps."""
+    nl = IPRoute(rcvsize=NETLINK_RECV_SIZE)
+    try:
+        # ACKs without the echoed request
+        nl.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, 1)
+    except OSError as e:
+        logger.debug(f"NETLINK_CAP_ACK not supported: {e}")
+    return nl
 
-            subprocess.run(["ip", "link", "del", f"vxlan{vni}"], check=True)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error deleting VXLAN interface for VNI {vni}: {e}")
-            raise TunnelManagerError(f"Error deleting VXLAN interface for VNI {vni}") from e
 
-    def validate_connectivity(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
-        src_port = port or self.DEFAULT_PORT
+def _netlink() -> Optional[Any]:
+    """Return the shared rtnetlink socket, or None when the `ip` command must be used instead."""
+    global _nl
+    if _nl is None and IPRoute is not None and hasattr(socket, "AF_NETLINK"):
+        _nl = _open_netlink()
+    return _nl
 
-        retries = 0
-        while retries < max_retries:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(timeout)
 
-                try:
-                    s.connect((dst_host, src_port))
-                    logger.info(f"Connectivity to {self.tunnel_type.upper()} VNI {vni} at {dst_host}:{src_port} from {src_host} is successful.")
-                    return
-                except socket.error as e:
-                    retries += 1
-                    logger.warning(f"Retry {retries}/{max_retries} - Failed to establish connectivity to {self.tunnel_type.upper()} VNI {vni} at {dst_host}:{src_port} from {src_host}: {e}")
-                    if retries == max_retries:
-                        logger.error(f"Failed to establish connectivity to {self.tunnel_type.upper()} VNI {vni} at {dst_host}:{src_port} from {src_host} after {max_retries} attempts.")
-                        raise TunnelManagerError(f"Failed to establish connectivity to {self.tunnel_type.upper()} VNI {vni} at {dst_host}:{src_port} from {src_host}") from e
+# Sockets the batch operations over netlink use at once
+_NETLINK_WORKERS = 4
 
-    def collect_tunnel_data(self) -> List[Dict[str, Any]]:
-        vxlan_data = []
+
+def _netlink_pool_map(nl: Any, fn: Callable[[Any, Dict[str, Any]], None], specs: List[Dict[str, Any]]) -> None:
+    """Call fn(socket, spec) for every spec from a small pool of rtnetlink sockets, stopping at the first failure."""
+    # A pyroute2 socket must not carry two requests at once, so each call borrows a socket for itself
+    extra = [_open_netlink() for _ in range(min(len(specs), _NETLINK_WORKERS) - 1)]
+    sockets: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+    for sock in (nl, *extra):
+        sockets.put(sock)
+
+    def call(spec: Dict[str, Any]) -> None:
+        sock = sockets.get()
         try:
-            result = subprocess.run(["ip", "-d", "link", "show", "type", "vxlan"], stdout=subprocess.PIPE, text=True)
-            vxlan_regex = re.compile(rf"\b(?P<ifname>\S+): .+ \bvxlan\b id (?P<vni>\d+) .+ local (?P<src_host>{self.ip_pattern}) remote (?P<dst_host>{self.ip_pattern}) .+ dstport (?P<dst_port>\d+)")
-
-            for line in result.stdout.split("\n"):
-                if match := vxlan_regex.search(line):
-                    details = match.groupdict()
-                    vxlan_details = dict(details.items())
-                    vxlan_data.append(vxlan_details)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error collecting VXLAN tunnel data: {e}")
-        return vxlan_data
+            fn(sock, spec)
+        finally:
+            sockets.put(sock)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(extra) + 1)
+    try:
+        for _ in pool.map(call, specs):
+            pass
+    finally:
+        # After a failure, specs not yet started are dropped, as the batch operations' other paths do
+        pool.shutdown(cancel_futures=True)
+        for sock in extra:
+            sock.close()
+
+
+# Interface names per kind and VNI, interned so repeated operations on a VNI reuse one string
+_IFNAME_INTERN: Dict[str, Dict[int, str]] = {}
+_IFNAME_INTERN_MAX = 4096
+
+
+def _ifname(kind: str, vni: int) -> str:
+    names = _IFNAME_INTERN.get(kind)
+    if names is None:
+        names = _IFNAME_INTERN[kind] = {}
+    name = names.get(vni)
+    if name is None:
+        if len(names) >= _IFNAME_INTERN_MAX:
+            names.clear()
+        name = names[vni] = sys.intern(f"{kind}{vni}")
+    return name
+
+
+# A word that is nothing but one string placeholder
+_WHOLE_WORD_PLACEHOLDER_RE = re.compile(r"%\((\w+)\)s")
+
+
+@functools.lru_cache(maxsize=32)
+def _placeholders(template: Tuple[str, ...]) -> Tuple[Tuple[int, str, Optional[str]], ...]:
+    """(position, word, name) of every word of an argv template that holds a `%(name)` placeholder.
+
+    name is set when the word is only a `%(name)s` placeholder, and None when the word must be formatted.
+    """
+    return tuple((i, word, match.group(1) if (match := _WHOLE_WORD_PLACEHOLDER_RE.fullmatch(word)) else None) for i, word in enumerate(template) if "%" in word)
+
+
+def _expand(template: Tuple[str, ...], **params: Any) -> List[str]:
+    """Fill the `%(name)` placeholders of an argv template; constant words are reused as-is."""
+    argv = list(template)
+    for i, word, name in _placeholders(template):
+        argv[i] = str(params[name]) if name else word % params
+    return argv
+
+
+@functools.lru_cache(maxsize=1)
+def _ip_batch_supported() -> bool:
+    """Whether `ip` is iproute2, which reads commands from stdin with -batch; BusyBox's applet does not."""
+    # The same lookup that gives subprocess the absolute path it spawns
+    path = _which("ip", os.environ.get("PATH"))
+    return path is not None and os.path.basename(os.path.realpath(path)) != "busybox"
+
+
+def _spawn_options(command: str) -> Dict[str, Any]:
+    """subprocess keyword arguments that let it start `command` with posix_spawn instead of fork and exec.
+
+    CPython only takes that path for an absolute executable with close_fds off. Leaving descriptors open
+    leaks nothing, since Python creates them non-inheritable (PEP 446).
+    """
+    path = _which(command, os.environ.get("PATH"))
+    return {"executable": path, "close_fds": False} if path else {}
+
+
+def _run(argv: Union[List[str], Tuple[str, ...]], **kwargs: Any) -> "subprocess.CompletedProcess[Any]":
+    """Run a command through posix_spawn, raising CalledProcessError if it fails; the one way commands are run."""
+    return subprocess.run(argv, check=True, **kwargs, **_spawn_options(argv[0]))
+
+
+# ip names the failing stdin line, e.g. "Command failed -:2"
+_BATCH_FAILED_RE = re.compile(r"Command failed -:(\d+)")
+
+
+def _run_batch(*argvs: List[str]) -> None:
+    """Run `ip` commands in order from one process, raising CalledProcessError for the first failure.
+
+    iproute2 reads them all with `ip -batch`; BusyBox's ip cannot, so its shell runs them as one script instead.
+    """
+    if _ip_batch_supported():
+        batch = ["ip", "-batch", "-"]
+        script = "".join(" ".join(argv[1:]) + "\n" for argv in argvs)
+    else:
+        # Fail-fast like -batch, and name the failing line the way ip does so both are read the same way
+        batch = ["sh", "-s"]
+        script = "".join(f"{shlex.join(argv)} || {{ echo 'Command failed -:{line}' >&2; exit 1; }}\n" for line, argv in enumerate(argvs, 1))
+    try:
+        _run(batch, input=script, stderr=subprocess.PIPE, text=True)
+    except subprocess.CalledProcessError as e:
+        sys.stderr.write(e.stderr or "")
+        match = _BATCH_FAILED_RE.search(e.stderr or "")
+        failed = argvs[min(int(match.group(1)), len(argvs)) - 1] if match else argvs[0]
+        raise subprocess.CalledProcessError(e.returncode, failed, stderr=e.stderr) from None
+
+
+def _link_index(nl: Any, ifname: str) -> int:
+    indexes = nl.link_lookup(ifname=ifname)
+    if not indexes:
+        raise TunnelManagerError(f"Interface {ifname} not found")
+    return indexes[0]
+
+
+# Bridge and underlay device indexes, which outlive the tunnels attached to them
+_ifindex_cache: Dict[str, int] = {}
+
+# Subscription to the kernel's link notifications, used to keep _ifindex_cache current
+_nl_events: Optional[Any] = None
+RTMGRP_LINK = 0x1
+# Bumped for every batch of link notifications read, and whenever the subscription is dropped
+_link_generation = 0
+
+# Tunnel kind -> (link generation, rows) of its last dump; kept here rather than on the tunnel
+# so that managers built per call, as the CLI and short scripts do, still share it
+_listings: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+
+
+def _drain_link_events() -> None:
+    """Evict cached indexes for links the kernel reported deleted or recreated since the last call."""
+    global _nl_events, _link_generation
+    if _nl_events is None:
+        _nl_events = IPRoute()
+        _nl_events.bind(groups=RTMGRP_LINK)
+    # Only pending notifications are read
+    while select.select([_nl_events], [], [], 0)[0]:
+        _link_generation += 1
+        try:
+            msgs = _nl_events.get()
+        except (OSError, NetlinkError) as e:
+            if getattr(e, "code", None) != errno.ENOBUFS and getattr(e, "errno", None) != errno.ENOBUFS:
+                raise
+            # The kernel dropped notifications that overflowed the buffer, so any cached index may be stale
+            _ifindex_cache.clear()
+            continue
+        for msg in msgs:
+            ifname = msg.get_attr("IFLA_IFNAME")
+            if ifname in _ifindex_cache and (msg["event"] == "RTM_DELLINK" or _ifindex_cache[ifname] != msg["index"]):
+                del _ifindex_cache[ifname]
+
+
+def _cached_link_index(nl: Any, ifname: str) -> int:
+    """The interface's index, looked up once; callers drain link events first so the cache is current."""
+    index = _ifindex_cache.get(ifname)
+    if index is None:
+        index = _ifindex_cache[ifname] = _link_index(nl, ifname)
+    return index
+
+
+def _forget_link_indexes(*ifnames: Optional[str]) -> None:
+    """Drop cached indexes after a failed operation, in case the interface was recreated."""
+    for ifname in ifnames:
+        _ifindex_cache.pop(ifname, None)
+
+
+@atexit.register
+def _close_netlink() -> None:
+    """Close the shared rtnetlink sockets; they are reopened on next use."""
+    global _nl, _nl_events, _link_generation
+    for sock in (_nl, _nl_events):
+        if sock is not None:
+            sock.close()
+    _nl = _nl_events = None
+    # Changes made while unsubscribed would go unseen
+    _link_generation += 1
+    _ifindex_cache.clear()
+
+
+# Managers inside a `with` block; the shared sockets are released when the last of them exits
+_context_users = 0
+_context_lock = threading.Lock()
+
+
+def _tunnel_links(nl: Any, kind: str, wanted: FrozenSet[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (ifname, wanted IFLA_INFO_DATA attributes by name) for every link of the given kind from one RTM_GETLINK dump."""
+    # Naming the kind in the dump request lets the kernel skip every other link;
+    # kernels without dump filtering send them all, so the kind is still checked here
+    request = ifinfmsg()
+    request["attrs"] = [("IFLA_LINKINFO", {"attrs": [("IFLA_INFO_KIND", kind)]})]
+    for link in nl.nlm_request(request, msg_type=RTM_GETLINK, msg_flags=NLM_F_REQUEST | NLM_F_DUMP):
+        linkinfo = link.get_attr("IFLA_LINKINFO")
+        if linkinfo is not None and linkinfo.get_attr("IFLA_INFO_KIND") == kind:
+            # Only the attributes a listing row reads are kept
+            data = linkinfo.get_attr("IFLA_INFO_DATA")
+            yield link.get_attr("IFLA_IFNAME"), {nla[0]: nla[1] for nla in data["attrs"] if nla[0] in wanted} if data is not None else {}
+
+
+# Stands in for missing linkinfo/info_data; never modified
+_NO_ATTRS: Dict[str, Any] = {}
+
+
+def _link_details(ifname: str, attrs: Dict[str, Any], keys: Dict[str, Tuple[str, ...]]) -> Dict[str, str]:
+    """One listing row from a link's tunnel attributes, taking each field from the first of its keys that is set."""
+    details = {"ifname": ifname}
+    for field, names in keys.items():
+        for name in names:
+            value = attrs.get(name)
+            if value is not None:
+                details[field] = str(value)
+                break
+    # Unset attributes are left out rather than listed as empty
+    return details
+
+
+class TunnelInterface(Protocol):
+    DEFAULT_PORT: int
+
+    def create_tunnel_interface(self, vni: int, src_host: str, dst_host: str, bridge_name: str, src_port: Optional[int] = None, dst_port: Optional[int] = None, dev: Optional[str] = "eth0") -> None:
+        raise NotImplementedError
+
+    def cleanup_tunnel_interface(self, vni: int, bridge_name: str) -> None:
+        raise NotImplementedError
+
+    def validate_connectivity(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
+        raise NotImplementedError
+
+    def collect_tunnel_data(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
 
+class TunnelType(Enum):
+    VXLAN = "vxlan"
+    GENEVE = "geneve"
 
-# Geneve-specific tunnel
-class GeneveTunnel(TunnelInterface):
-    DEFAULT_PORT = 6081
 
-    def __init__(self, bridge_tool: str = "ip") -> None:
+@dataclass(frozen=True)
+class TunnelSpec:
+    """Everything that tells one `ip link` tunnel kind apart from another."""
+
+    kind: str
+    # How log and error messages name the kind
+    label: str
+    default_port: int
+    add_argv: Tuple[str, ...]
+    # `ip -j` info_data keys for each listed field, in listing order, IPv4 before IPv6
+    json_keys: Dict[str, Tuple[str, ...]]
+    # pyroute2 keyword for each create parameter the kind carries over netlink
+    netlink_args: Dict[str, str]
+    # Keywords replacing those of netlink_args for address parameters given as IPv6
+    netlink_args6: Dict[str, str]
+    # IFLA_INFO_DATA attributes for each listed field, IPv4 before IPv6
+    info_data_keys: Dict[str, Tuple[str, ...]]
+    # First word of the encapsulation header a connectivity probe carries; the VNI word follows it
+    probe_header: bytes
+
+
+_SPECS = {
+    TunnelType.VXLAN: TunnelSpec(
+        kind="vxlan",
+        label="VXLAN",
+        default_port=4789,
+        add_argv=("ip", "link", "add", "%(ifname)s", "master", "%(bridge_name)s", "up", "type", "vxlan", "id", "%(vni)d", "local", "%(src_host)s", "remote", "%(dst_host)s", "dstport", "%(dst_port)d"),
+        # ip says remote for a unicast peer and group for a multicast one, both IFLA_VXLAN_GROUP
+        json_keys={"vni": ("id",), "src_host": ("local", "local6"), "dst_host": ("remote", "group", "remote6", "group6"), "dst_port": ("port",)},
+        netlink_args={"vni": "vxlan_id", "src_host": "vxlan_local", "dst_host": "vxlan_group", "dst_port": "vxlan_port", "dev": "vxlan_link"},
+        netlink_args6={"src_host": "vxlan_local6", "dst_host": "vxlan_group6"},
+        info_data_keys={"vni": ("IFLA_VXLAN_ID",), "src_host": ("IFLA_VXLAN_LOCAL", "IFLA_VXLAN_LOCAL6"), "dst_host": ("IFLA_VXLAN_GROUP", "IFLA_VXLAN_GROUP6"), "dst_port": ("IFLA_VXLAN_PORT",)},
+        # RFC 7348: the I flag, marking the VNI valid
+        probe_header=b"\x08\x00\x00\x00",
+    ),
+    TunnelType.GENEVE: TunnelSpec(
+        kind="geneve",
+        label="Geneve",
+        default_port=6081,
+        add_argv=("ip", "link", "add", "%(ifname)s", "master", "%(bridge_name)s", "up", "type", "geneve", "id", "%(vni)d", "remote", "%(dst_host)s", "dstport", "%(dst_port)d"),
+        json_keys={"vni": ("id",), "dst_host": ("remote", "remote6"), "dst_port": ("port",)},
+        # Geneve links carry no local address or underlay device attribute
+        netlink_args={"vni": "geneve_id", "dst_host": "geneve_remote", "dst_port": "geneve_port"},
+        netlink_args6={"dst_host": "geneve_remote6"},
+        info_data_keys={"vni": ("IFLA_GENEVE_ID",), "dst_host": ("IFLA_GENEVE_REMOTE", "IFLA_GENEVE_REMOTE6"), "dst_port": ("IFLA_GENEVE_PORT",)},
+        # RFC 8926: version 0, no options, carrying Ethernet (0x6558)
+        probe_header=b"\x00\x00\x65\x58",
+    ),
+}
+
+
+# Any tunnel kind `ip link` creates from an id, a remote and a destination port
+class IPTunnel(TunnelInterface):
+    _DELIF_ARGV = ("brctl", "delif", "%(bridge_name)s", "%(ifname)s")
+    _DEL_ARGV = ("ip", "link", "del", "%(ifname)s")
+
+    def __init__(self, spec: TunnelSpec, bridge_tool: str = "ip") -> None:
+        self.spec = spec
         self.bridge_tool = bridge_tool
-        self.tunnel_type = "geneve"
+        self.tunnel_type = spec.kind
+        self.DEFAULT_PORT = spec.default_port
+        self._list_argv = ("ip", "-d", "-j", "link", "show", "type", spec.kind)
+        self._info_data_names = frozenset(name for names in spec.info_data_keys.values() for name in names)
 
     def create_tunnel_interface(self, vni: int, src_host: str, dst_host: str, bridge_name: str, src_port: Optional[int] = None, dst_port: Optional[int] = None, dev: Optional[str] = "eth0") -> None:
-        src_port = src_port or self.DEFAULT_PORT
-        dst_port = dst_port or self.DEFAULT_PORT
+        spec = self.spec
+        src_port = src_port or spec.default_port
+        dst_port = dst_port or spec.default_port
+
+        nl = _netlink()
+        if nl is not None:
+            _drain_link_events()
+            self._create_netlink(nl, vni, src_host, dst_host, bridge_name, dst_port, dev)
+            return
 
         try:
-            subprocess.run(["ip", "link", "add", f"geneve{vni}", "type", "geneve", "id", str(vni), "remote", dst_host, "local", src_host, "dev", dev, "dstport", str(dst_port)], check=True)
-            subprocess.run(["ip", "link", "set", f"geneve{vni}", "up"], check=True)
-            subprocess.run(["ip", "link", "set", "master", bridge_name, f"geneve{vni}"], check=True)
+            _run(self._create_argv(_ifname(spec.kind, vni), vni, src_host, dst_host, bridge_name, dst_port, dev))
         except subprocess.CalledProcessError as e:
-            logger.error(f"Error creating Geneve interface for VNI {vni}: {e}")
-            raise TunnelManagerError(f"Error creating Geneve interface for VNI {vni}") from e
+            logger.error(f"Error creating {spec.label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error creating {spec.label} interface for VNI {vni}") from e
+
+    def _create_netlink(self, nl: Any, vni: int, src_host: str, dst_host: str, bridge_name: str, dst_port: int, dev: Optional[str]) -> None:
+        """Create the link with one RTM_NEWLINK, trusting the cached bridge and device indexes as they stand."""
+        spec = self.spec
+        netlink_args = spec.netlink_args
+        params = {"vni": vni, "src_host": src_host, "dst_host": dst_host, "dst_port": dst_port}
+        link_args = {netlink_args[name]: value for name, value in params.items() if name in netlink_args}
+        # `ip link` tells the families apart itself; over netlink IPv6 addresses go in attributes of their own
+        for name, keyword6 in spec.netlink_args6.items():
+            if ":" in params[name]:
+                link_args[keyword6] = link_args.pop(netlink_args[name])
+        # Only kinds with an underlay device attribute look the device up
+        dev = dev if "dev" in netlink_args else None
+        try:
+            if dev:
+                link_args[netlink_args["dev"]] = _cached_link_index(nl, dev)
+            # One RTM_NEWLINK creates the link already up and enslaved to the bridge
+            nl.link("add", ifname=_ifname(spec.kind, vni), kind=spec.kind, state="up", master=_cached_link_index(nl, bridge_name), **link_args)
+        except (NetlinkError, TunnelManagerError) as e:
+            _forget_link_indexes(bridge_name, dev)
+            logger.error(f"Error creating {spec.label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error creating {spec.label} interface for VNI {vni}") from e
+
+    def _create_argv(self, ifname: str, vni: int, src_host: str, dst_host: str, bridge_name: str, dst_port: int, dev: Optional[str]) -> List[str]:
+        """The `ip link add` command creating the link already enslaved to the bridge and up.
+
+        As over netlink, the kernel applies master and up within the RTM_NEWLINK that creates the link
+        and creates nothing if either fails, so no half-configured link is ever left to roll back.
+        """
+        argv = _expand(self.spec.add_argv, ifname=ifname, vni=vni, src_host=src_host, dst_host=dst_host, dst_port=dst_port, bridge_name=bridge_name)
+        # As over netlink, only kinds with an underlay device attribute take one
+        if dev and "dev" in self.spec.netlink_args:
+            argv += ["dev", dev]
+        return argv
 
     def cleanup_tunnel_interface(self, vni: int, bridge_name: str) -> None:
+        nl = _netlink()
+        if nl is not None:
+            self._cleanup_netlink(nl, vni)
+            return
+
+        label = self.spec.label
+        ifname = _ifname(self.spec.kind, vni)
+
         try:
             if self.bridge_tool == "brctl":
-                subprocess.run(["brctl", "delif", bridge_name, f"geneve{vni}"], check=True)
-            else:
-                subprocess.run(["ip", "link", "set", f"geneve{vni}", "nomaster"], check=True)
-
-            subprocess.run(["ip", "link", "del", f"geneve{vni}"], check=True)
+                _run(_expand(self._DELIF_ARGV, ifname=ifname, bridge_name=bridge_name))
+            # As over netlink, deleting the link detaches it from its bridge, so with ip a single process does both
+            _run(_expand(self._DEL_ARGV, ifname=ifname))
         except subprocess.CalledProcessError as e:
-            logger.error(f"Error deleting Geneve interface for VNI {vni}: {e}")
-            raise TunnelManagerError(f"Error deleting Geneve interface for VNI {vni}") from e
+            logger.error(f"Error deleting {label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error deleting {label} interface for VNI {vni}") from e
 
-    def validate_connectivity(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
-        src_port = port or self.DEFAULT_PORT
+    def _cleanup_netlink(self, nl: Any, vni: int) -> None:
+        # Deleting the link also detaches it from its bridge
+        try:
+            nl.link("del", ifname=_ifname(self.spec.kind, vni))
+        except NetlinkError as e:
+            logger.error(f"Error deleting {self.spec.label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error deleting {self.spec.label} interface for VNI {vni}") from e
 
-        retries = 0
-        while retries < max_retries:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(timeout)
+    def _probe_payload(self, vni: int) -> bytes:
+        """The tunnel header a connectivity probe sends: the kind's first header word, then the VNI and a reserved byte."""
+        return self.spec.probe_header + struct.pack("!I", vni << 8)
 
-                try:
-                    s.connect((dst_host, src_port))
-                    logger.info(f"Connectivity to Geneve VNI {vni} at {dst_host}:{src_port} from {src_host} is successful.")
+    def validate_connectivity(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
+        label = self.spec.label
+        src_port = port or self.spec.default_port
+        try:
+            addresses = _resolve(dst_host, src_port)
+        except socket.gaierror as e:
+            logger.error(f"Failed to resolve {label} VNI {vni} endpoint {dst_host}: {e}")
+            raise TunnelManagerError(f"Failed to resolve {label} VNI {vni} endpoint {dst_host}") from e
+
+        # `timeout` bounds the whole validation: failures back off instead of resending into the same error at once
+        delays = _retry_delays(time.monotonic() + timeout)
+        with contextlib.closing(_probe_attempts(addresses, self._probe_payload(vni), timeout, src_host)) as attempts:
+            retries = 0
+            while retries < max_retries:
+                err = next(attempts)
+                if err == 0:
+                    logger.info("No rejection from %s VNI %s at %s:%s from %s (best-effort: UDP peers need not reply).", label, vni, dst_host, src_port, src_host)
                     return
-                except socket.error as e:
-                    retries += 1
-                    logger.warning(f"Retry {retries}/{max_retries} - Failed to establish connectivity to Geneve VNI {vni} at {dst_host}:{src_port} from {src_host}: {e}")
-                    if retries == max_retries:
-                        logger.error(f"Failed to establish connectivity to Geneve VNI {vni} at {dst_host}:{src_port} from {src_host} after {max_retries} attempts.")
-                        raise TunnelManagerError(f"Failed to establish connectivity to Geneve VNI {vni} at {dst_host}:{src_port} from {src_host}") from e
+                retries += 1
+                logger.warning("Retry %s/%s - Failed to establish connectivity to %s VNI %s at %s:%s from %s: %s", retries, max_retries, label, vni, dst_host, src_port, src_host, os.strerror(err))
+                # A refused port is the one definite answer UDP gives, and a retry could only pass by meeting the peer's ICMP rate limit
+                if err == errno.ECONNREFUSED:
+                    break
+                if retries < max_retries:
+                    delay = next(delays, None)
+                    if delay is None:
+                        break
+                    time.sleep(delay)
+
+        logger.error(f"Failed to establish connectivity to {label} VNI {vni} at {dst_host}:{src_port} from {src_host} after {retries} attempts.")
+        raise TunnelManagerError(f"Failed to establish connectivity to {label} VNI {vni} at {dst_host}:{src_port} from {src_host}")
 
     def collect_tunnel_data(self) -> List[Dict[str, Any]]:
-        geneve_data = []
+        nl = _netlink()
+        if nl is None:
+            return self._dump_ip() or []
+        # Every link notification bumps the generation, so while it is unchanged the last dump still holds;
+        # the subscription is in place before the first dump, so no change can slip in unseen
+        _drain_link_events()
+        generation = _link_generation
+        listing = _listings.get(self.spec.kind)
+        if listing is not None and listing[0] == generation:
+            # Callers get their own rows, so the cached ones cannot be changed under the cache
+            return [dict(row) for row in listing[1]]
+
+        rows = self._dump_netlink(nl)
+        if rows is None:
+            return []
+        _listings[self.spec.kind] = (generation, rows)
+        return [dict(row) for row in rows]
+
+    def _dump_netlink(self, nl: Any) -> Optional[List[Dict[str, Any]]]:
+        spec = self.spec
         try:
-            result = subprocess.run(["ip", "-d", "link", "show", "type", "geneve"], stdout=subprocess.PIPE, text=True)
-            geneve_regex = re.compile(rf"\b(?P<ifname>\S+): .+ \bgeneve\b id (?P<vni>\d+) .+ remote (?P<dst_host>{self.ip_pattern}) local (?P<src_host>{self.ip_pattern}) .+ dstport (?P<dst_port>\d+)")
-
-            for line in result.stdout.split("\n"):
-                if match := geneve_regex.search(line):
-                    details = match.groupdict()
-                    geneve_details = dict(details.items())
-                    geneve_data.append(geneve_details)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error collecting Geneve tunnel data: {e}")
-
-        return geneve_data
-
+            return [_link_details(ifname, info, spec.info_data_keys) for ifname, info in _tunnel_links(nl, spec.kind, self._info_data_names)]
+        except NetlinkError as e:
+            logger.error(f"Error collecting {spec.label} tunnel data: {e}")
+            return None
 
-class TunnelType(Enum):
-    VXLAN = "vxlan"
-    GENEVE = "geneve"
+    def _dump_ip(self) -> Optional[List[Dict[str, Any]]]:
+        spec = self.spec
+        try:
+            stdout = _run(self._list_argv, stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+            links = _json_loads(stdout) if stdout and not stdout.isspace() else []
+        except subprocess.CalledProcessError as e:
+            detail = e.stderr.decode(errors="replace").strip() if e.stderr else ""
+            logger.error(f"Error collecting {spec.label} tunnel data: {e}" + (f": {detail}" if detail else ""))
+            return None
+        except ValueError as e:
+            logger.error(f"Error parsing {spec.label} tunnel data: {e}")
+            return None
+        return [_link_details(link["ifname"], link.get("linkinfo", _NO_ATTRS).get("info_data", _NO_ATTRS), spec.json_keys) for link in links]
 
 
 class TunnelFactory:
     @staticmethod
     def create_tunnel(tunnel_type: TunnelType, **kwargs: Any) -> TunnelInterface:
-        if tunnel_type == TunnelType.VXLAN:
-            return VXLANTunnel(**kwargs)
-        elif tunnel_type == TunnelType.GENEVE:
-            return GeneveTunnel(**kwargs)
-        else:
-            raise ValueError(f"Unsupported tunnel type: {tunnel_type}")
+        try:
+            spec = _SPECS[tunnel_type]
+        except KeyError:
+            raise ValueError(f"Unsupported tunnel type: {tunnel_type}") from None
+        return IPTunnel(spec, **kwargs)
 
 
 class OutputFormatType(Enum):
@@ -205,82 +787,385 @@ class OutputFormatterStrategy(Protocol):
     def format(self, data: Any) -> str:
         ...
 
+    def write(self, data: Any, stream: TextIO) -> None:
+        output = self.format(data)
+        buffer = getattr(stream, "buffer", None)
+        if buffer is None:
+            stream.write(output)
+            stream.write("\n")
+            return
+        stream.flush()
+        buffer.write(output.encode(stream.encoding or "utf-8", stream.errors or "strict"))
+        buffer.write(b"\n")
+
+
+def _orjson_dumps(data: Any) -> str:
+    # Same layout as json.dumps(indent=2)
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+
+
+def _stdlib_json_dumps(data: Any) -> str:
+    return json.dumps(data, indent=2)
+
+
+_json_dumps = _orjson_dumps if orjson is not None else _stdlib_json_dumps
+
 
 class JsonFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
-        return json.dumps(data, indent=2)
+        return _json_dumps(data)
+
+    def write(self, data: Any, stream: TextIO) -> None:
+        buffer = getattr(stream, "buffer", None)
+        if orjson is None or buffer is None:
+            super().write(data, stream)
+            return
+        # orjson already produces UTF-8 bytes
+        stream.flush()
+        buffer.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
 
 
 class YamlFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
-        return yaml.dump(data, default_flow_style=False)
+        # libyaml's emitter when PyYAML was built with it; fields keep their collection order
+        return yaml.dump(data, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+
+    def write(self, data: Any, stream: TextIO) -> None:
+        yaml.dump(data, stream, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+
+
+# Field names become element names verbatim, so only plain XML names are allowed
+_XML_NAME_RE = re.compile(r"[A-Za-z_][\w.-]*\Z")
+
+
+@functools.lru_cache(maxsize=256)
+def _xml_tags(name: str) -> Tuple[str, str]:
+    if not _XML_NAME_RE.match(name) or name[:3].lower() == "xml":
+        raise ValueError(f"Invalid XML element name: {name!r}")
+    return f"<{name}>", f"</{name}>"
+
+
+@functools.lru_cache(maxsize=64)
+def _xml_row_template(names: Tuple[str, ...]) -> str:
+    """A str.format template for one <Interface> element whose fields are named and ordered as given."""
+    return "<Interface>" + "".join(open_tag + "{}" + close_tag for open_tag, close_tag in map(_xml_tags, names)) + "</Interface>"
+
+
+# Interfaces handed to the stream per write call
+_XML_WRITE_BATCH = 256
 
 
 class XmlFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
-        root = ElementTree.Element("TunnelInterfaces")
+        return "".join(self._chunks(data))
+
+    def write(self, data: Any, stream: TextIO) -> None:
+        # A bounded batch of rows per write keeps memory flat
+        chunks = self._chunks(data)
+        while batch := "".join(itertools.islice(chunks, _XML_WRITE_BATCH)):
+            stream.write(batch)
+        stream.write("\n")
+
+    @staticmethod
+    def _chunks(data: Any) -> Iterator[str]:
+        # The rows are flat, so the document is written as escaped text
+        yield "<TunnelInterfaces>"
         for item in data:
-            interface = ElementTree.SubElement(root, "Interface")
-            for key, value in item.items():
-                ElementTree.SubElement(interface, key).text = str(value)
-        return ElementTree.tostring(root, encoding="unicode")
+            values = list(map(str, item.values()))
+            # Addresses and numbers never need escaping
+            text = "".join(values)
+            if "&" in text or "<" in text or ">" in text:
+                values = [escape(value) for value in values]
+            yield _xml_row_template(tuple(item)).format(*values)
+        yield "</TunnelInterfaces>"
+
+
+@contextlib.contextmanager
+def _block_buffered(stream: TextIO) -> Iterator[TextIO]:
+    """Suspend a stream's line buffering, on by default for a terminal, so many lines cost one flush."""
+    line_buffering = getattr(stream, "line_buffering", False)
+    if line_buffering:
+        stream.reconfigure(line_buffering=False)  # type: ignore[attr-defined]
+    try:
+        yield stream
+    finally:
+        if line_buffering:
+            # Reconfiguring flushes what the rows left in the buffer
+            stream.reconfigure(line_buffering=True)  # type: ignore[attr-defined]
 
 
 class CsvFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
         if not data:
             return ""
-        csv_output = io.StringIO()
-        writer = csv.DictWriter(csv_output, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-        return csv_output.getvalue()
+        text = self._joined(data)
+        if text is not None:
+            return text
+        buffer = io.StringIO()
+        self._write_rows(data, buffer)
+        return buffer.getvalue()
+
+    def write(self, data: Any, stream: TextIO) -> None:
+        if not data:
+            return
+        text = self._joined(data)
+        if text is not None:
+            stream.write(text)
+            return
+        self._write_rows(data, stream)
+
+    @staticmethod
+    def _columns(data: Any) -> Tuple[List[str], Iterator[Any]]:
+        """Every field any row carries, in first-seen order, and each row's cells; "" where a row leaves a field unset."""
+        headers = list(dict.fromkeys(key for item in data for key in item))
+        if not headers:
+            # Only line terminators, as DictWriter writes for no fields
+            return headers, ([] for _ in data)
+        if all(len(item) == len(headers) for item in data):
+            getter = operator.itemgetter(*headers)
+            return headers, (map(getter, data) if len(headers) > 1 else ((getter(item),) for item in data))
+        return headers, ([item.get(header, "") for header in headers] for item in data)
+
+    @classmethod
+    def _joined(cls, data: Any) -> Optional[str]:
+        """The whole document as plain comma joins, or None when some cell needs csv's quoting."""
+        headers, rows = cls._columns(data)
+        # A lone empty cell is quoted by csv so its row is not blank
+        if len(headers) < 2:
+            return None
+        try:
+            lines = [",".join(headers)]
+            lines += map(",".join, rows)
+        except TypeError:
+            # Not every cell is a string
+            return None
+        rows = len(lines)
+        lines.append("")
+        text = "\r\n".join(lines)
+        # A delimiter, quote or line break in any cell needs csv's quoting
+        if text.count(",") != rows * (len(headers) - 1) or text.count("\n") != rows or text.count("\r") != rows or '"' in text:
+            return None
+        return text
+
+    @classmethod
+    def _write_rows(cls, data: Any, stream: TextIO) -> None:
+        # Rows go straight to the stream, so a large listing is never held as one string
+        headers, rows = cls._columns(data)
+        # One flush for all rows on a terminal
+        with _block_buffered(stream):
+            writer = csv.writer(stream)
+            writer.writerow(headers)
+            writer.writerows(rows)
 
 
 class ScriptFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
-        return ", ".join([": ".join([key, str(val)]) for item in data for key, val in item.items()])
+        return ", ".join([f"{key}: {val}" for item in data for key, val in item.items()])
 
 
 class TableFormatter(OutputFormatterStrategy):
     def format(self, data: Any) -> str:
-        table = str()
-        headers = data[0].keys() if data else []
-        table += " | ".join(str(item.get(header, "")) for header in headers) + "\n"
-        table += "-+-".join(["-" * len(header) for header in headers]) + "\n"
-        for item in data:
-            table += " | ".join(item.values()) + "\n"
-        return table
+        if not data:
+            return ""
+        headers = list(dict.fromkeys(key for item in data for key in item))
+        columns = [[str(item.get(header, "")) for item in data] for header in headers]
+        widths = [max(len(header), *map(len, column)) for header, column in zip(headers, columns)]
+        row_format = " | ".join(f"{{:<{width}}}" for width in widths)
+        lines = [row_format.format(*headers), "-+-".join("-" * width for width in widths)]
+        lines.extend(row_format.format(*row) for row in zip(*columns))
+        lines.append("")
+        return "\n".join(lines)
 
 
 class OutputFormatterFactory:
     formatters = {OutputFormatType.JSON: JsonFormatter(), OutputFormatType.YAML: YamlFormatter(), OutputFormatType.XML: XmlFormatter(), OutputFormatType.CSV: CsvFormatter(), OutputFormatType.SCRIPT: ScriptFormatter(), OutputFormatType.TABLE: TableFormatter()}
 
+    # Keyed by the CLI spelling
+    formatters_by_name = {format_type.value: formatter for format_type, formatter in formatters.items()}
+
+    get_formatter: Callable[[OutputFormatType], OutputFormatterStrategy] = staticmethod(formatters.__getitem__)
+
     @staticmethod
-    def get_formatter(format_type: OutputFormatType) -> OutputFormatterStrategy:
-        return OutputFormatterFactory.formatters[format_type]
+    def get_by_name(name: str) -> OutputFormatterStrategy:
+        try:
+            return OutputFormatterFactory.formatters_by_name[name]
+        except KeyError:
+            raise ValueError(f"Unsupported output format: {name}") from None
 
 
 class TunnelManager:
-    def __init__(self, tunnel: TunnelInterface) -> None:
+    __slots__ = ("tunnel", "_create", "_cleanup", "_validate", "_list")
+
+    def __init__(self, tunnel: Union[TunnelInterface, TunnelType]) -> None:
+        if isinstance(tunnel, TunnelType):
+            tunnel = TunnelFactory.create_tunnel(tunnel)
         self.tunnel: TunnelInterface = tunnel
+        self._create = tunnel.create_tunnel_interface
+        self._cleanup = tunnel.cleanup_tunnel_interface
+        self._validate = tunnel.validate_connectivity
+        self._list = tunnel.collect_tunnel_data
+
+    def __enter__(self) -> "TunnelManager":
+        global _context_users
+        with _context_lock:
+            _context_users += 1
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        global _context_users
+        # The rtnetlink sockets are process-wide; later use reopens them
+        with _context_lock:
+            _context_users -= 1
+            if not _context_users:
+                _close_netlink()
 
     def create(self, vni: int, src_host: str, dst_host: str, bridge_name: str, src_port: Optional[int] = None, dst_port: Optional[int] = None, dev: Optional[str] = None) -> None:
-        self.tunnel.create_tunnel_interface(vni, src_host, dst_host, bridge_name, src_port, dst_port, dev)
+        self._create(vni, src_host, dst_host, bridge_name, src_port, dst_port, dev)
+
+    def create_many(self, specs: Iterable[Dict[str, Any]]) -> None:
+        """Create one tunnel per spec; each spec holds the keyword arguments of `create`."""
+        specs = list(specs)
+        # Batching needs IPTunnel's own argv and netlink builders; other tunnels create one at a time
+        if len(specs) > 1 and isinstance(self.tunnel, IPTunnel):
+            nl = _netlink()
+            if nl is not None:
+                self._create_netlink_many(nl, self.tunnel, specs)
+            else:
+                self._create_batched(self.tunnel, specs)
+            return
+        for spec in specs:
+            self.create(**spec)
+
+    @staticmethod
+    def _create_netlink_many(nl: Any, tunnel: IPTunnel, specs: List[Dict[str, Any]]) -> None:
+        """Send the specs' RTM_NEWLINKs from a small pool of sockets, reading link notifications once for the whole batch."""
+        _drain_link_events()
+        specs = [{"src_port": None, "dst_port": None, "dev": None, **spec} for spec in specs]
+        # Bridges and devices are looked up once up front; a failed lookup is retried and reported by its link
+        names = {spec["bridge_name"] for spec in specs}
+        if "dev" in tunnel.spec.netlink_args:
+            names.update(spec["dev"] for spec in specs if spec["dev"])
+        for name in names:
+            with contextlib.suppress(NetlinkError, TunnelManagerError):
+                _cached_link_index(nl, name)
+
+        def create(sock: Any, spec: Dict[str, Any]) -> None:
+            tunnel._create_netlink(sock, spec["vni"], spec["src_host"], spec["dst_host"], spec["bridge_name"], spec["dst_port"] or tunnel.DEFAULT_PORT, spec["dev"])
+
+        _netlink_pool_map(nl, create, specs)
+
+    @staticmethod
+    def _create_batched(tunnel: IPTunnel, specs: List[Dict[str, Any]]) -> None:
+        """Submit every spec's `ip link add` to one batch process, stopping at the first failure like `create` would."""
+        argvs = []
+        for spec in specs:
+            spec = {"src_port": None, "dst_port": None, "dev": None, **spec}
+            ifname = _ifname(tunnel.tunnel_type, spec["vni"])
+            argvs.append(tunnel._create_argv(ifname, spec["vni"], spec["src_host"], spec["dst_host"], spec["bridge_name"], spec["dst_port"] or tunnel.DEFAULT_PORT, spec["dev"]))
+        try:
+            _run_batch(*argvs)
+        except subprocess.CalledProcessError as e:
+            # Links before the failing one are complete, later ones were never started and the failed one was not created
+            vni = next(spec["vni"] for spec, argv in zip(specs, argvs) if argv is e.cmd)
+            logger.error(f"Error creating {tunnel.spec.label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error creating {tunnel.spec.label} interface for VNI {vni}") from e
 
     def cleanup(self, vni: int, bridge_name: str) -> None:
-        self.tunnel.cleanup_tunnel_interface(vni, bridge_name)
+        self._cleanup(vni, bridge_name)
+
+    def cleanup_many(self, specs: Iterable[Dict[str, Any]]) -> None:
+        """Delete one tunnel per spec; each spec holds the keyword arguments of `cleanup`."""
+        specs = list(specs)
+        tunnel = self.tunnel
+        if len(specs) > 1 and isinstance(tunnel, IPTunnel):
+            nl = _netlink()
+            if nl is not None:
+                _netlink_pool_map(nl, lambda sock, spec: tunnel._cleanup_netlink(sock, spec["vni"]), specs)
+                return
+            # brctl's delif cannot join an `ip -batch`
+            if tunnel.bridge_tool == "ip":
+                self._cleanup_batched(tunnel, specs)
+                return
+        for spec in specs:
+            self.cleanup(**spec)
 
-    def validate(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None) -> None:
-        self.tunnel.validate_connectivity(src_host, dst_host, vni, port)
+    @staticmethod
+    def _cleanup_batched(tunnel: IPTunnel, specs: List[Dict[str, Any]]) -> None:
+        """Submit every spec's `ip link del` to one batch process, stopping at the first failure like `cleanup` would."""
+        argvs = [_expand(tunnel._DEL_ARGV, ifname=_ifname(tunnel.tunnel_type, spec["vni"])) for spec in specs]
+        try:
+            _run_batch(*argvs)
+        except subprocess.CalledProcessError as e:
+            vni = next(spec["vni"] for spec, argv in zip(specs, argvs) if argv is e.cmd)
+            logger.error(f"Error deleting {tunnel.spec.label} interface for VNI {vni}: {e}")
+            raise TunnelManagerError(f"Error deleting {tunnel.spec.label} interface for VNI {vni}") from e
+
+    def validate(self, src_host: str, dst_host: str, vni: int, port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> None:
+        self._validate(src_host, dst_host, vni, port, timeout, max_retries)
+
+    def validate_many(self, targets: Iterable[Tuple[str, str, int]], port: Optional[int] = None, timeout: int = 3, max_retries: int = 3) -> List[bool]:
+        """Probe every (src_host, dst_host, vni) concurrently; each retry round re-probes only the failures together."""
+        targets = list(targets)
+        tunnel = self.tunnel
+        if not isinstance(tunnel, IPTunnel):
+            # Concurrent probes need IPTunnel's probe payload; other tunnels are validated one at a time
+            results = []
+            for src_host, dst_host, vni in targets:
+                try:
+                    self.validate(src_host, dst_host, vni, port, timeout, max_retries)
+                except TunnelManagerError:
+                    results.append(False)
+                else:
+                    results.append(True)
+            return results
+        port = port or tunnel.DEFAULT_PORT
+        lookups = _resolve_many([dst_host for _, dst_host, _ in targets], port)
+        resolved: List[Optional[Tuple[int, Tuple[Any, ...]]]] = []
+        for src_host, dst_host, vni in targets:
+            lookup = lookups[dst_host]
+            if isinstance(lookup, socket.gaierror):
+                logger.warning("Failed to resolve VNI %s endpoint %s: %s", vni, dst_host, lookup)
+                resolved.append(None)
+            else:
+                resolved.append(lookup)
+        payloads = [tunnel._probe_payload(vni) for _, _, vni in targets]
+        errors = [errno.EHOSTUNREACH] * len(targets)
+        pending = [i for i, target in enumerate(resolved) if target is not None]
+        delays = _retry_delays(time.monotonic() + timeout)
+        for attempt in range(max_retries):
+            if not pending:
+                break
+            if attempt:
+                # Rounds back off like validate_connectivity's retries, within the same overall timeout
+                delay = next(delays, None)
+                if delay is None:
+                    break
+                time.sleep(delay)
+            for i, err in zip(pending, _probe_many([resolved[i] for i in pending], [payloads[i] for i in pending], timeout, [targets[i][0] for i in pending])):
+                errors[i] = err
+            # As in validate_connectivity, a refusal is final
+            pending = [i for i in pending if errors[i] and errors[i] != errno.ECONNREFUSED]
+
+        results = []
+        for (src_host, dst_host, vni), target, err in zip(targets, resolved, errors):
+            # An unresolved endpoint was reported when its lookup failed
+            if err and target is not None:
+                logger.warning("Failed to establish connectivity to VNI %s at %s:%s from %s: %s", vni, dst_host, port, src_host, os.strerror(err))
+            results.append(err == 0)
+        return results
 
     def list(self) -> List[Dict[str, Any]]:
-        return self.tunnel.collect_tunnel_data()
+        return self._list()
+
+    # Actions reachable by name; anything else on the instance stays out of reach
+    _ACTIONS = {"create": create, "create_many": create_many, "cleanup": cleanup, "cleanup_many": cleanup_many, "validate": validate, "validate_many": validate_many, "list": list}
 
     def execute_action(self, action: str, **kwargs: Any) -> Any:
-        if method := getattr(self, action):
-            return method(**kwargs)
-        raise ValueError(f"No method available for action: {action}")
+        try:
+            method = self._ACTIONS[action]
+        except KeyError:
+            raise ValueError(f"No method available for action: {action}") from None
+        return method(self, **kwargs)
 
 
 class CommandValidator(Protocol):
@@ -291,71 +1176,162 @@ class CommandValidator(Protocol):
         ...
 
 
+@functools.lru_cache(maxsize=64)
+def _which(command: str, path: Optional[str]) -> Optional[str]:
+    """shutil.which, memoized per command and PATH value so repeated checks skip the directory walk."""
+    return shutil.which(command, path=path)
+
+
 class SystemCommandValidator(CommandValidator):
     def check_command_existence(self, command: str) -> bool:
-        return shutil.which(command) is not None
+        return _which(command, os.environ.get("PATH")) is not None
 
     def check_bridge_tool_existence(self, bridge_tool: str) -> None:
         if not self.check_command_existence(bridge_tool):
             raise RuntimeError(f"Error: The bridge tool '{bridge_tool}' is not found. Please install it.")
 
 
-def main() -> None:
+def _add_create_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--vni", type=int, help="VNI (Virtual Network Identifier) (required without --spec-file)")
+    parser.add_argument("--src-host", help="Source host IP address (required without --spec-file)")
+    parser.add_argument("--dst-host", help="Destination host IP address (required without --spec-file)")
+    parser.add_argument("--bridge-name", help="Bridge name to associate with the tunnel interface (required without --spec-file)")
+    parser.add_argument("--spec-file", help="JSON list of tunnels, each an object of create's arguments, to create in one batch")
+    parser.add_argument("--src-port", type=int, help="Source port (optional)")
+    parser.add_argument("--dst-port", type=int, help="Destination port (optional)")
+    parser.add_argument("--dev", help="Device (optional)")
+
+
+def _add_cleanup_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--vni", type=int, required=True, help="VNI (Virtual Network Identifier)")
+    parser.add_argument("--bridge-name", required=True, help="Bridge name associated with the tunnel interface")
+
+
+def _add_validate_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--src-host", help="Source host IP address (required without --hosts-file)")
+    parser.add_argument("--dst-host", help="Destination host IP address (required without --hosts-file)")
+    parser.add_argument("--vni", type=int, help="VNI (Virtual Network Identifier) (required without --hosts-file)")
+    parser.add_argument("--hosts-file", help="File of 'src_host dst_host vni' lines to validate concurrently")
+    parser.add_argument("--port", type=int, help="Port (optional)")
+    parser.add_argument("--retries", type=int, default=3, help="Number of retries for connectivity validation (default: %(default)s)")
+    parser.add_argument("--timeout", type=int, default=3, help="Time limit in seconds for connectivity validation, retries included (default: %(default)s)")
+
+
+def _add_list_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("-fo", "--format", choices=[format_type.value for format_type in OutputFormatType], default=OutputFormatType.TABLE.value, help="Output format for listing tunnels (default: %(default)s)")
+    parser.add_argument("-fi", "--fields", nargs="+", choices=["all", *sorted(_LISTING_FIELDS)], default="all", metavar="FIELD", help=f"Fields to display for listing tunnel interfaces: all, {', '.join(sorted(_LISTING_FIELDS))}")
+
+
+# Sub-command name -> (help, function adding its arguments)
+_COMMANDS = {
+    "create": ("create a tunnel interface", _add_create_arguments),
+    "cleanup": ("cleanup a tunnel interface", _add_cleanup_arguments),
+    "validate": ("validate connectivity of a tunnel interface", _add_validate_arguments),
+    "list": ("list all tunnel interfaces", _add_list_arguments),
+}
+
+
+_CREATE_REQUIRED = frozenset(["vni", "src_host", "dst_host", "bridge_name"])
+_CREATE_KEYS = _CREATE_REQUIRED | {"src_port", "dst_port", "dev"}
+# Optional keys may also be null
+_CREATE_TYPES = {"vni": int, "src_port": int, "dst_port": int, "src_host": str, "dst_host": str, "bridge_name": str, "dev": str}
+
+
+def _read_create_specs(path: str) -> List[Dict[str, Any]]:
+    """Read a JSON list of tunnel specs, each holding the keyword arguments of `TunnelManager.create`."""
+    with open(path, "rb") as spec_file:
+        specs = _json_loads(spec_file.read())
+    if not isinstance(specs, list):
+        raise ValueError(f"{path}: expected a JSON list of tunnel specs")
+    for i, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not _CREATE_REQUIRED <= spec.keys() <= _CREATE_KEYS:
+            raise ValueError(f"{path}: spec {i} needs {', '.join(sorted(_CREATE_REQUIRED))} and may add {', '.join(sorted(_CREATE_KEYS - _CREATE_REQUIRED))}")
+        for key, value in spec.items():
+            if value is None and key not in _CREATE_REQUIRED:
+                continue
+            expected = _CREATE_TYPES[key]
+            # bool is an int subclass, but true is no VNI or port
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise ValueError(f"{path}: spec {i}: {key} must be {'an integer' if expected is int else 'a string'}")
+    return specs
+
+
+def _read_validate_targets(path: str) -> List[Tuple[str, str, int]]:
+    """Read (src_host, dst_host, vni) targets, one per line; blank lines and # comments are skipped."""
+    targets = []
+    with open(path) as hosts_file:
+        for lineno, line in enumerate(hosts_file, 1):
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            if len(fields) != 3 or not fields[2].isdigit():
+                raise ValueError(f"{path}:{lineno}: expected 'src_host dst_host vni'")
+            src_host, dst_host, vni = fields
+            targets.append((src_host, dst_host, int(vni)))
+    return targets
+
+
+# Every field a listing row can carry
+_LISTING_FIELDS = frozenset(["ifname"]).union(*(spec.json_keys for spec in _SPECS.values()))
+
+
+def _select_fields(data: List[Dict[str, Any]], fields: Union[str, List[str]]) -> List[Dict[str, Any]]:
+    """Keep only the requested fields of each row, in the requested order; "all" keeps rows as they are."""
+    if fields == "all" or "all" in fields:
+        return data
+    known = tuple(dict.fromkeys(field for field in fields if field in _LISTING_FIELDS))
+    return [{field: item[field] for field in known if field in item} for item in data]
+
+
+def _build_parser(argv: List[str]) -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Manage VXLAN and GENEVE tunnels between bridges.")
-    parser.add_argument("--tunnel-type", type=TunnelType, choices=[tunnel_type.value for tunnel_type in TunnelType], default=TunnelType.VXLAN.value, help="Type of tunnel to create (default: %(default)s)")
+    parser.add_argument("--tunnel-type", choices=[tunnel_type.value for tunnel_type in TunnelType], default=TunnelType.VXLAN.value, help="Type of tunnel to create (default: %(default)s)")
     parser.add_argument("--bridge-tool", choices=["ip", "brctl"], default="ip", help="Bridge tool to use (default: %(default)s)")
     subparsers = parser.add_subparsers(dest="command", help="sub-command help")
 
-    # Create the parser for the "create" command
-    parser_create = subparsers.add_parser("create", help="create a tunnel interface")
-    parser_create.add_argument("--vni", type=int, required=True, help="VNI (Virtual Network Identifier)")
-    parser_create.add_argument("--src-host", required=True, help="Source host IP address")
-    parser_create.add_argument("--dst-host", required=True, help="Destination host IP address")
-    parser_create.add_argument("--bridge-name", required=True, help="Bridge name to associate with the tunnel interface")
-    parser_create.add_argument("--src-port", type=int, help="Source port (optional)")
-    parser_create.add_argument("--dst-port", type=int, help="Destination port (optional)")
-    parser_create.add_argument("--dev", help="Device (optional)")
-
-    # Create the parser for the "cleanup" command
-    parser_cleanup = subparsers.add_parser("cleanup", help="cleanup a tunnel interface")
-    parser_cleanup.add_argument("--vni", type=int, required=True, help="VNI (Virtual Network Identifier)")
-    parser_cleanup.add_argument("--bridge-name", required=True, help="Bridge name associated with the tunnel interface")
-
-    # Create the parser for the "validate" command
-    parser_validate = subparsers.add_parser("validate", help="validate connectivity of a tunnel interface")
-    parser_validate.add_argument("--src-host", required=True, help="Source host IP address")
-    parser_validate.add_argument("--dst-host", required=True, help="Destination host IP address")
-    parser_validate.add_argument("--vni", type=int, required=True, help="VNI (Virtual Network Identifier)")
-    parser_validate.add_argument("--port", type=int, help="Port (optional)")
-    parser_validate.add_argument("--retries", type=int, default=3, help="Number of retries for connectivity validation (default: %(default)s)")
-    parser_validate.add_argument("--timeout", type=int, default=3, help="Timeout in seconds for connectivity validation (default: %(default)s)")
-
-    # Create the parser for the "list" command
-    parser_list = subparsers.add_parser("list", help="list all tunnel interfaces")
-    parser_list.add_argument("-fo", "--format", type=OutputFormatType, choices=[format_type.value for format_type in OutputFormatType], default=OutputFormatType.TABLE.value, help="Output format for listing tunnels (default: %(default)s)")
-    parser_list.add_argument("-fi", "--fields", nargs="+", default="all", help="Fields to display for listing tunnel interfaces")
-
-    args = parser.parse_args()
+    # Every command stays listed, but only the one being run gets its arguments; no global option value is a command name
+    command = next((arg for arg in argv if arg in _COMMANDS), None)
+    for name, (help_text, add_arguments) in _COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        if name == command:
+            add_arguments(subparser)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = _build_parser(argv)
+    args = parser.parse_args(argv)
     command_validator = SystemCommandValidator()
     command_validator.check_bridge_tool_existence(args.bridge_tool)
 
     try:
-        tunnel = TunnelFactory.create_tunnel(args.tunnel_type)
+        tunnel = TunnelFactory.create_tunnel(TunnelType(args.tunnel_type))
         manager = TunnelManager(tunnel)
         if args.command == "create":
-            manager.create(args.vni, args.src_host, args.dst_host, args.bridge_name, args.src_port, args.dst_port, args.dev)
+            if args.spec_file:
+                manager.create_many(_read_create_specs(args.spec_file))
+            elif None in (args.vni, args.src_host, args.dst_host, args.bridge_name):
+                parser.error("create requires --vni, --src-host, --dst-host and --bridge-name, or --spec-file")
+            else:
+                manager.create(args.vni, args.src_host, args.dst_host, args.bridge_name, args.src_port, args.dst_port, args.dev)
         elif args.command == "cleanup":
             manager.cleanup(args.vni, args.bridge_name)
         elif args.command == "validate":
-            manager.validate(args.src_host, args.dst_host, args.vni, args.src_port or args.dst_port, args.timeout, args.retries)
+            if args.hosts_file:
+                if not all(manager.validate_many(_read_validate_targets(args.hosts_file), args.port, args.timeout, args.retries)):
+                    raise TunnelManagerError("Connectivity validation failed for one or more tunnels")
+            elif None in (args.src_host, args.dst_host, args.vni):
+                parser.error("validate requires --src-host, --dst-host and --vni, or --hosts-file")
+            else:
+                manager.validate(args.src_host, args.dst_host, args.vni, args.port, args.timeout, args.retries)
         elif args.command == "list":
-            data = manager.list()
-            formatter = OutputFormatterFactory.get_formatter(args.output_format)
-            print(formatter.format(data))
+            data = _select_fields(manager.list(), args.fields)
+            OutputFormatterFactory.get_by_name(args.format).write(data, sys.stdout)
         else:
             parser.print_help()
-    except Exception as e:
-        logger.error(str(e))
+    except (TunnelManagerError, ValueError, OSError, subprocess.SubprocessError) as e:
+        logger.error("%s", e)
         sys.exit(1)
 
 